@@ -1,6 +1,8 @@
+import itertools
 import os
 import re
 from dataclasses import dataclass, field
+from functools import cache
 from typing import Any
 
 from dotenv import load_dotenv
@@ -8,51 +10,83 @@ from dotenv import load_dotenv
 load_dotenv()
 
 
+@cache
+def env(key: str, default: str | None = None) -> str | None:
+    """
+    Возвращает значение переменной окружения, читая его один раз за процесс.
+
+    Args:
+        key: Имя переменной.
+        default: Значение по умолчанию.
+    """
+    return os.environ.get(key, default)
+
+
 @dataclass
 class DatabaseConfig:
     """Конфигурация подключения к базе данных"""
 
-    host: str = os.getenv("DB_HOST", "localhost")
-    database: str = os.getenv("DB_NAME", "postgres")
-    user: str = os.getenv("DB_USER", "postgres")
-    password: str | None = os.getenv("DB_PASSWORD")
-    port: int = int(os.getenv("DB_PORT", "5432"))
+    host: str = field(default_factory=lambda: env("DB_HOST", "localhost"))
+    database: str = field(default_factory=lambda: env("DB_NAME", "postgres"))
+    user: str = field(default_factory=lambda: env("DB_USER", "postgres"))
+    password: str | None = field(default_factory=lambda: env("DB_PASSWORD"))
+    port: int = field(default_factory=lambda: int(env("DB_PORT", "5432")))
+    # asyncpg кэширует подготовленные выражения на каждом соединении пула (LRU по тексту запроса)
+    statement_cache_size: int = field(default_factory=lambda: int(env("DB_STATEMENT_CACHE_SIZE", "100")))
+    # Простаивающие соединения пула закрываются через столько секунд
+    max_inactive_connection_lifetime: float = field(default_factory=lambda: float(env("DB_MAX_INACTIVE_LIFETIME", "300")))
+    # Подключение через pgbouncer в режиме transaction: без кэша выражений и без LISTEN
+    pgbouncer: bool = field(default_factory=lambda: env("DB_PGBOUNCER", "0") == "1")
+
+    def __post_init__(self) -> None:
+        if self.pgbouncer:
+            self.statement_cache_size = 0
 
 
 @dataclass
 class LlmConfig:
     """Конфигурация подключения к llm"""
 
-    key: str | None = os.getenv("OPENROUTER_API_KEY")
-    url: str = os.getenv("LLM_URL", "https://openrouter.ai/api/v1")
+    key: str | None = field(default_factory=lambda: env("OPENROUTER_API_KEY"))
+    url: str = field(default_factory=lambda: env("LLM_URL", "https://openrouter.ai/api/v1"))
     # "qwen/qwen3-14b" "mistralai/ministral-8b" "z-ai/glm-4.5-air" "x-ai/grok-4-fast"
     model: dict[str, str] = field(default_factory=lambda: {
-        "default": os.getenv("LLM_DEFAULT_MODEL", "x-ai/grok-4-fast"),
-        "check": os.getenv("LLM_CHECK_MODEL", "mistralai/ministral-8b"),
-        "perplexity": os.getenv("LLM_PERPLEXITY_MODEL", "perplexity/sonar")
+        "default": env("LLM_DEFAULT_MODEL", "x-ai/grok-4-fast"),
+        "check": env("LLM_CHECK_MODEL", "mistralai/ministral-8b"),
+        "perplexity": env("LLM_PERPLEXITY_MODEL", "perplexity/sonar")
     })
+    # Максимум одновременных запросов одного клиента на процесс (по лимитам RPM провайдера)
+    max_concurrency: int = field(default_factory=lambda: int(env("LLM_MAX_CONCURRENCY", "20")))
+    # Повторы SDK при 408/409/429/5xx и сетевых ошибках: экспоненциальная задержка с jitter, учитывает Retry-After
+    max_retries: int = field(default_factory=lambda: int(env("LLM_MAX_RETRIES", "5")))
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class LlmResponse:
     text: str | None
     json: dict[str, Any] | None
     raw: Any
-    usage: dict | None
+    usage: Any
 
 
 source_table_name = "person_source_data"
 cleaned_table_name = "cleaned_person_source_data"
 result_table_name = "person_result_data"
+llm_cache_table_name = "llm_response_cache"
 
-EMOJI_PATTERN = re.compile(r"["
-    r"\U0001F600-\U0001F64F"  # эмотиконы
-    r"\U0001F300-\U0001F5FF"  # символы и пиктограммы
-    r"\U0001F680-\U0001F6FF"  # транспорт и символы карт
-    r"\U0001F1E0-\U0001F1FF"  # флаги
-    r"\U00002700-\U000027BF"  # разнообразные символы
-    r"\U0001F900-\U0001F9FF"  # дополнение к эмодзи
-r"]+", flags=re.UNICODE)
+EMOJI_CODEPOINT_RANGES = (
+    (0x1F600, 0x1F64F),  # эмотиконы
+    (0x1F300, 0x1F5FF),  # символы и пиктограммы
+    (0x1F680, 0x1F6FF),  # транспорт и символы карт
+    (0x1F1E0, 0x1F1FF),  # флаги
+    (0x2700, 0x27BF),    # разнообразные символы
+    (0x1F900, 0x1F9FF),  # дополнение к эмодзи
+)
+# Таблица для str.translate: удаление эмодзи без regex-прохода
+EMOJI_TABLE: dict[int, None] = dict.fromkeys(
+    itertools.chain.from_iterable(range(start, end + 1) for start, end in EMOJI_CODEPOINT_RANGES)
+)
+ZERO_WIDTH_CHARS = "\u200b\u200c\u200d\ufeff"
 URL_PATTERN = re.compile(r'https?://\S+|t\.me/\S+|@[\w_]+')
 ENRU_CHARS_PATTERN = re.compile(r'[^A-Za-zА-Яа-яЁё\s-]+')
 
@@ -64,7 +98,25 @@ PATH_PRM_MEDIA = 'prm_media/'
 PATH_PERSON_TG_AVATARS = 'telegram/avatars/'
 
 MAX_RETRIES = 3
+RETRY_WAIT_MIN = 0.2
+RETRY_WAIT_MAX = 4.0
 ASYNC_WORKERS = 5
+CHUNK_SIZE = 10
+# Сколько людей отправлять в LLM одним запросом на этапе llm (1 — по одному)
+LLM_PARSE_BATCH_SIZE = int(env("LLM_PARSE_BATCH_SIZE", "8"))
+# Размер общего пула соединений: max_size не больше (max_connections сервера / число процессов)
+DB_POOL_MIN_SIZE = int(env("DB_POOL_MIN_SIZE", str(ASYNC_WORKERS)))
+DB_POOL_MAX_SIZE = int(env("DB_POOL_MAX_SIZE", str(ASYNC_WORKERS * 2)))
+# Сколько строк серверный курсор экспорта забирает за один сетевой запрос
+EXPORT_PREFETCH = int(env("EXPORT_PREFETCH", "500"))
+LLM_CACHE_ENABLED = env("LLM_CACHE_ENABLED", "1") == "1"
+# Память процесса перед кэшем в БД: число записей и время жизни записи, сек.
+LLM_MEMORY_CACHE_SIZE = int(env("LLM_MEMORY_CACHE_SIZE", "50000"))
+LLM_MEMORY_CACHE_TTL = 86400.0
+# Срок годности кэша результатов Perplexity, сек.: веб-выдача со временем устаревает
+PERP_CACHE_MAX_AGE = float(env("PERP_CACHE_MAX_AGE", str(7 * 86400)))
+TASK_QUEUE_CHANNEL = "task_queue_new"
+TASK_WAIT_TIMEOUT = 3.0
 
 TASK_TYPES = ["prellm", "llm", "perp", "postcheck1", "postcheck2"]  # TODO: "photos"
 
@@ -96,36 +148,91 @@ NEXT_TASK = {
 }
 
 # ----- sql_queries -----
-SELECT_PERSONS_BASE_QUERY = f"SELECT * FROM {result_table_name}"
+SELECT_PERSONS_BASE_QUERY = f"SELECT person_id, telegram_id, summary, urls, confidence, valid FROM {result_table_name}"
 UPDATE_MEANINGFUL_FIELDS_QUERY = f"""
     UPDATE {result_table_name}
     SET meaningful_first_name = $1,
         meaningful_last_name = $2,
         meaningful_about = $3,
-        extracted_links = $4
+        extracted_links = $4,
+        flag_prellm = TRUE
     WHERE person_id = $5
 """
-UPDATE_LLM_RESULTS_QUERY = f"""
+SELECT_PRELLM_ROW_QUERY = f"""
+    SELECT person_id, first_name, last_name, about,
+           personal_channel_title, personal_channel_about
+    FROM {result_table_name}
+    WHERE person_id = $1
+"""
+SELECT_PERP_BATCH_QUERY = f"""
+    SELECT person_id, meaningful_first_name, meaningful_last_name,
+           meaningful_about, extracted_links
+    FROM {result_table_name}
+    WHERE person_id = ANY($1::bigint[]) AND valid = TRUE
+"""
+SELECT_POSTCHECK1_BATCH_QUERY = f"""
+    SELECT person_id, summary
+    FROM {result_table_name}
+    WHERE person_id = ANY($1::bigint[]) AND flag_perp = TRUE
+"""
+SELECT_POSTCHECK2_BATCH_QUERY = f"""
+    SELECT person_id, meaningful_first_name, meaningful_last_name,
+           meaningful_about, extracted_links, summary, urls, confidence
+    FROM {result_table_name}
+    WHERE person_id = ANY($1::bigint[]) AND flag_postcheck1 = TRUE
+"""
+SELECT_LLM_BATCH_QUERY = f"""
+    SELECT person_id, meaningful_first_name, meaningful_last_name, meaningful_about, extracted_links
+    FROM {result_table_name}
+    WHERE person_id = ANY($1::bigint[])
+"""
+UPDATE_LLM_RESULTS_BATCH_QUERY = f"""
+    UPDATE {result_table_name} AS t
+    SET meaningful_first_name = u.first_name,
+        meaningful_last_name = u.last_name,
+        meaningful_about = u.about,
+        valid = u.valid,
+        flag_llm = TRUE
+    FROM unnest($1::bigint[], $2::text[], $3::text[], $4::text[], $5::boolean[])
+        AS u(person_id, first_name, last_name, about, valid)
+    WHERE t.person_id = u.person_id
+"""
+UPDATE_PRELLM_FLAG_FAILED_QUERY = f"""
     UPDATE {result_table_name}
-    SET meaningful_first_name = $1,
-        meaningful_last_name = $2,
-        meaningful_about = $3,
-        valid = $4
-    WHERE person_id = $5
+    SET flag_prellm = FALSE
+    WHERE person_id = $1
+"""
+UPDATE_LLM_FLAG_FAILED_BATCH_QUERY = f"""
+    UPDATE {result_table_name}
+    SET flag_llm = FALSE
+    WHERE person_id = ANY($1::bigint[])
 """
 UPDATE_SUMMARY_QUERY = f"""
     UPDATE {result_table_name}
     SET summary = $1,
         urls = $2,
-        confidence = $3
+        confidence = $3,
+        flag_perp = TRUE
     WHERE person_id = $4
 """
+UPDATE_POSTCHECK1_RESULT_QUERY = f"""
+    UPDATE {result_table_name}
+    SET flag_postcheck1 = $1,
+        done = CASE WHEN $1 THEN done ELSE FALSE END
+    WHERE person_id = $2
+"""
+UPDATE_POSTCHECK2_RESULT_QUERY = f"""
+    UPDATE {result_table_name}
+    SET flag_postcheck2 = $1,
+        done = $1
+    WHERE person_id = $2
+"""
 UPDATE_PHOTOS_QUERY = f"""
     UPDATE {result_table_name}
     SET photos = $1
     WHERE person_id = $2
 """
-DROP_AND_CREATE_TASK_QUEUE_QUERY = """
+DROP_AND_CREATE_TASK_QUEUE_QUERY = f"""
     DROP TABLE IF EXISTS task_queue;
     CREATE TABLE IF NOT EXISTS task_queue (
         id SERIAL PRIMARY KEY,
@@ -140,10 +247,21 @@ DROP_AND_CREATE_TASK_QUEUE_QUERY = """
     );
     CREATE INDEX IF NOT EXISTS idx_task_status ON task_queue (status);
     CREATE INDEX IF NOT EXISTS idx_task_person ON task_queue (person_id);
+    CREATE INDEX IF NOT EXISTS idx_task_pending ON task_queue (created_at) WHERE status = 'pending';
+    CREATE OR REPLACE FUNCTION notify_task_queue_new() RETURNS trigger AS $$
+    BEGIN
+        PERFORM pg_notify('{TASK_QUEUE_CHANNEL}', '');
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+    CREATE TRIGGER task_queue_new_notify
+        AFTER INSERT ON task_queue
+        FOR EACH STATEMENT EXECUTE FUNCTION notify_task_queue_new();
 """
 DROP_AND_CREATE_CLEANED_TABLE_QUERY = f"""
     DROP TABLE IF EXISTS {cleaned_table_name};
-    CREATE TABLE {cleaned_table_name} AS
+    CREATE UNLOGGED TABLE {cleaned_table_name}
+    WITH (fillfactor = 100, parallel_workers = 4) AS
     SELECT DISTINCT ON ((data->>'telegram_id')::bigint) *
     FROM {source_table_name}
     WHERE data ? 'about'
@@ -176,13 +294,30 @@ DROP_AND_CREATE_RESULT_TABLE_QUERY = f"""
         null::text AS meaningful_first_name,
         null::text AS meaningful_last_name,
         null::text AS meaningful_about,
-        ARRAY[]::text[] AS extracted_links,
+        '[]'::jsonb AS extracted_links,
         null::text AS summary,
         null::text AS confidence,
-        ARRAY[]::text[] AS urls,
+        '[]'::jsonb AS urls,
         ARRAY[]::text[] AS photos
-    FROM {cleaned_table_name}
-"""  # TODO: убрать Where person_id = 3578 or person_id = 1537
+    FROM {cleaned_table_name};
+    CREATE INDEX IF NOT EXISTS idx_result_done ON {result_table_name} (done, person_id);
+"""
+CREATE_LLM_CACHE_TABLE_QUERY = f"""
+    CREATE TABLE IF NOT EXISTS {llm_cache_table_name} (
+        key TEXT PRIMARY KEY,
+        response JSONB NOT NULL,
+        created_at TIMESTAMP DEFAULT NOW()
+    );
+"""
+SELECT_LLM_CACHE_QUERY = f"""
+    SELECT response FROM {llm_cache_table_name}
+    WHERE key = $1 AND ($2::float8 IS NULL OR created_at > NOW() - make_interval(secs => $2::float8))
+"""
+INSERT_LLM_CACHE_QUERY = f"""
+    INSERT INTO {llm_cache_table_name} (key, response)
+    VALUES ($1, $2)
+    ON CONFLICT (key) DO UPDATE SET response = EXCLUDED.response, created_at = NOW()
+"""
 STATS_QUERY = f"""
     SELECT
         COUNT(*) AS total_persons,
@@ -194,11 +329,24 @@ STATS_QUERY = f"""
     FROM {result_table_name};
 """
 SELECT_DONE_QUERY = f"""
-    SELECT *
+    SELECT person_id, first_name, last_name, username, about,
+           personal_channel_title, personal_channel_about,
+           meaningful_first_name, meaningful_last_name, meaningful_about,
+           extracted_links, summary, urls, photos
     FROM {result_table_name}
     WHERE done = TRUE
     ORDER BY person_id;
 """
+# JSON-экспорт отдаёт все колонки результата (как прежний SELECT *), но списком явно
+SELECT_EXPORT_JSON_QUERY = f"""
+    SELECT person_id, fetch_date, telegram_id, first_name, last_name, birth_date, about, username,
+           personal_channel_title, personal_channel_username, personal_channel_about, personal_channel_id,
+           flag_prellm, flag_llm, valid, flag_perp, flag_postcheck1, flag_postcheck2, done, flag_photos,
+           meaningful_first_name, meaningful_last_name, meaningful_about,
+           extracted_links, summary, confidence, urls, photos
+    FROM {result_table_name}
+    WHERE done = TRUE;
+"""
 TAKE_PENDING_TASK_QUERY = """
     UPDATE task_queue
     SET status = 'in_progress', started_at = NOW()
@@ -211,4 +359,16 @@ TAKE_PENDING_TASK_QUERY = """
     )
     RETURNING id, person_id, task_type;
 """
+TAKE_PENDING_TASKS_BY_TYPE_QUERY = """
+    UPDATE task_queue
+    SET status = 'in_progress', started_at = NOW()
+    WHERE id IN (
+        SELECT id FROM task_queue
+        WHERE status = 'pending' AND task_type = $1
+        ORDER BY created_at
+        FOR UPDATE SKIP LOCKED
+        LIMIT $2
+    )
+    RETURNING id, person_id, task_type;
+"""
 # and task_type like 'llm' 'perp' 'postcheck1' 'postcheck2'
@@ -1,161 +1,211 @@
+import asyncio
 import logging
+from itertools import starmap
 
 import config
-from llm.llm_client import LlmClient
-from utils.db import AsyncDatabaseManager
+from llm.base_llm_client import LlmRequestError
+from llm.llm_client import LlmClient, MeaningfulFields, get_llm_client
+from pydantic import ValidationError
+from utils.db import AsyncDatabaseManager, get_db
+from utils.retry import async_retry
 
 logger = logging.getLogger(__name__)
 
 
-async def fetch_person_data(db: AsyncDatabaseManager, person_id: int) -> dict | None:
+async def fetch_persons_batch(db: AsyncDatabaseManager, person_ids: list[int]) -> dict[int, dict]:
     """
-    Получает подготовленные данные человека для LLM из базы данных.
+    Получает подготовленные данные пачки людей для LLM одним запросом.
 
     Args:
         db: Асинхронный менеджер базы данных.
-        person_id: ID персоны.
+        person_ids: Список ID персон.
 
     Returns:
-        dict | None: Словарь с данными или None, если человек не найден.
+        dict[int, dict]: Данные людей по person_id (ненайденные отсутствуют).
     """
-    query = f"""
-        SELECT person_id, meaningful_first_name, meaningful_last_name, meaningful_about, extracted_links
-        FROM {config.result_table_name}
-        WHERE person_id = $1
-    """
-    rows = await db.fetch(query, person_id)
-    if not rows:
-        logger.warning(f"[person_id={person_id}] ⚠️ Человек не найден в БД")
-        return None
-    return rows[0]
+    rows = await db.fetch(config.SELECT_LLM_BATCH_QUERY, person_ids)
+    return {row["person_id"]: row for row in rows}
+
+
+def build_llm_input(
+    person_id: int,
+    first_name: str | None,
+    last_name: str | None,
+    about: str | None,
+    extracted_links: list[str] | None
+) -> dict:
+    """Формирует входные данные для LLM из колонок строки БД (в порядке SELECT)."""
+    return {
+        "person_id": person_id,
+        "first_name": first_name,
+        "last_name": last_name,
+        "about": about,
+        "extracted_links": extracted_links
+    }
+
+
+def is_valid_result(result: MeaningfulFields, extracted_links: list[str] | None) -> bool:
+    """Проверяет, достаточно ли извлечённых полей для дальнейшего поиска."""
+    return bool(
+        result.meaningful_first_name
+        and result.meaningful_last_name
+        and (result.meaningful_about or extracted_links)
+    )
 
 
-async def attempt_llm_parse(
+@async_retry(
+    config.MAX_RETRIES,
+    wait_min=config.RETRY_WAIT_MIN,
+    wait_max=config.RETRY_WAIT_MAX,
+    retry_on=(ValidationError,),
+)
+async def parse_meaningful_fields(llm: LlmClient, llm_input: dict) -> MeaningfulFields:
+    """Запрос meaningful-полей у LLM с повторами, пока ответ не пройдёт валидацию."""
+    return await llm.async_parse_single_to_meaningful(llm_input)
+
+
+async def request_meaningful_fields(
     llm: LlmClient,
     llm_input: dict,
-    db: AsyncDatabaseManager,
     person_id: int,
     worker_id: int
-) -> bool:
+) -> MeaningfulFields | None:
     """
-    Пытается обработать одного человека через LLM с несколькими попытками.
+    Запрашивает у LLM meaningful-поля одного человека с несколькими попытками.
 
     Args:
         llm: Клиент LLM.
         llm_input: Входные данные для LLM.
-        db: Менеджер базы данных.
         person_id: ID человека.
         worker_id: ID воркера для логирования.
 
     Returns:
-        bool: True, если обработка успешна, False иначе.
+        MeaningfulFields | None: Ответ LLM или None, если все попытки неудачны.
     """
-    for attempt in range(1, config.MAX_RETRIES + 1):
-        try:
-            result = await llm.async_parse_single_to_meaningful(llm_input)
-            if not isinstance(result, dict) or not result:
-                logger.warning(
-                    f"[Воркер #{worker_id}][person_id={person_id}] ❌ "
-                    f"LLM вернула некорректный результат. Попытка {attempt}/{config.MAX_RETRIES}. "
-                    f"Тип: {type(result)}"
-                )
-                continue
-
-            first_name = result.get('meaningful_first_name')
-            last_name = result.get('meaningful_last_name')
-            about = result.get('meaningful_about')
-            extracted_links = llm_input.get('extracted_links')
-
-            is_valid = bool(first_name and last_name and (about or extracted_links))
-
-            await db.execute(
-                config.UPDATE_LLM_RESULTS_QUERY,
-                first_name, last_name, about, is_valid, person_id
-            )
-
-            logger.debug(
-                f"[Воркер #{worker_id}][person_id={person_id}] "
-                f"LLM обработка успешна на попытке {attempt}"
-            )
-            return True
-
-        except Exception as e:
-            logger.error(
-                f"[Воркер #{worker_id}][person_id={person_id}] "
-                f"Ошибка при обработке LLM на попытке {attempt}: {e}",
-                exc_info=True
-            )
-
-    logger.error(f"[Воркер #{worker_id}][person_id={person_id}] ❌ Все {config.MAX_RETRIES} попыток LLM неудачны")
-    return False
-
-
-async def process_single_person(
+    try:
+        result = await parse_meaningful_fields(llm, llm_input)
+    except Exception as e:
+        logger.error(
+            f"[Воркер #{worker_id}][person_id={person_id}] ❌ Все {config.MAX_RETRIES} попыток LLM неудачны: {e}",
+            exc_info=True
+        )
+        return None
+
+    logger.debug("[Воркер #%s][person_id=%s] LLM обработка успешна", worker_id, person_id)
+    return result
+
+
+async def parse_persons(
     llm: LlmClient,
-    db: AsyncDatabaseManager,
-    person_id: int,
+    inputs: dict[int, dict],
+    batch_size: int,
+    semaphore: asyncio.Semaphore,
     worker_id: int
-) -> bool:
+) -> dict[int, MeaningfulFields | None]:
     """
-    Обрабатывает одного человека через LLM.
+    Запрашивает meaningful-поля для группы людей, по batch_size человек в одном запросе к LLM.
+
+    Пачки идут параллельно (не более семафора одновременно). Людей, для которых модель
+    не вернула корректный результат, переспрашивает пачками вдвое меньше; при batch_size 1 —
+    по одному, с повторами request_meaningful_fields. Отказ самого запроса (сеть, 5xx) уже
+    повторён SDK (max_retries), поэтому такая пачка не дробится и не повторяется: её люди получают None.
 
     Args:
         llm: Клиент LLM.
-        db: Менеджер базы данных.
-        person_id: ID человека.
-        worker_id: ID воркера.
+        inputs: Входные данные для LLM по person_id.
+        batch_size: Сколько людей отправлять в одном запросе.
+        semaphore: Ограничение одновременных запросов к LLM.
+        worker_id: ID воркера для логирования.
 
     Returns:
-        bool: True, если успешно, False иначе.
+        dict[int, MeaningfulFields | None]: Ответ по каждому person_id (None — все попытки неудачны).
     """
-    logger.debug(f"[Воркер #{worker_id}][person_id={person_id}] Начало LLM обработки")
-
-    person_data = await fetch_person_data(db, person_id)
-    if not person_data:
-        return False
-
-    llm_input = {
-        "person_id": person_data["person_id"],
-        "first_name": person_data.get("meaningful_first_name", ""),
-        "last_name": person_data.get("meaningful_last_name", ""),
-        "about": person_data.get("meaningful_about", ""),
-        "extracted_links": person_data.get("extracted_links")
-    }
-
-    return await attempt_llm_parse(llm, llm_input, db, person_id, worker_id)
+    if batch_size <= 1:
+        async def request_single(person_id: int, llm_input: dict) -> tuple[int, MeaningfulFields | None]:
+            async with semaphore:
+                return person_id, await request_meaningful_fields(llm, llm_input, person_id, worker_id)
+
+        return dict(await asyncio.gather(*starmap(request_single, inputs.items())))
+
+    async def request_chunk(chunk: list[int]) -> dict[int, MeaningfulFields | None]:
+        async with semaphore:
+            try:
+                parsed: dict[int, MeaningfulFields | None] = await llm.async_parse_batch_to_meaningful([inputs[i] for i in chunk])
+            except LlmRequestError as e:
+                logger.error(f"[Воркер #{worker_id}] ❌ Запрос LLM для пачки из {len(chunk)} человек не выполнен: {e}")
+                return dict.fromkeys(chunk)
+            except Exception as e:
+                logger.warning(f"[Воркер #{worker_id}] ⚠️ Ошибка LLM для пачки из {len(chunk)} человек: {e}")
+                parsed = {}
+        missing = {person_id: inputs[person_id] for person_id in chunk if person_id not in parsed}
+        if missing:
+            logger.debug("[Воркер #%s] Нет результата LLM для %s из %s человек, повтор пачками по %s",
+                         worker_id, len(missing), len(chunk), batch_size // 2)
+            parsed |= await parse_persons(llm, missing, batch_size // 2, semaphore, worker_id)
+        return parsed
+
+    person_ids = list(inputs)
+    chunks = [person_ids[i:i + batch_size] for i in range(0, len(person_ids), batch_size)]
+    results: dict[int, MeaningfulFields | None] = {}
+    for parsed in await asyncio.gather(*map(request_chunk, chunks)):
+        results |= parsed
+    return results
 
 
 async def run(worker_id: int, person_id: int) -> bool:
     """
-    Основной обработчик LLM для одного человека.
+    Основной обработчик LLM для одного человека — обёртка над run_batch.
 
     Args:
         worker_id: ID воркера.
         person_id: ID человека.
     """
-    logger.debug(f"[Воркер #{worker_id}][person_id={person_id}] Запуск LLM handler")
+    results = await run_batch(worker_id, [person_id])
+    if not results.get(person_id):
+        raise Exception(f"Не удалось обработать person_id {person_id} через LLM после {config.MAX_RETRIES} попыток")
+    return True
 
-    db = AsyncDatabaseManager()
-    await db.connect()
-    llm = LlmClient()
 
-    try:
-        success = await process_single_person(llm, db, person_id, worker_id)
-        flag_query = f"UPDATE {config.result_table_name} SET flag_llm = $1 WHERE person_id = $2"
-
-        if success:
-            await db.execute(flag_query, True, person_id)
-            logger.debug(f"[Воркер #{worker_id}][person_id={person_id}] ✅ LLM завершен успешно")
-            return True
-        else:
-            await db.execute(flag_query, False, person_id)
-            logger.error(f"[Воркер #{worker_id}][person_id={person_id}] ❌ LLM завершен с ошибкой")
-            raise Exception(f"Не удалось обработать person_id {person_id} через LLM после {config.MAX_RETRIES} попыток")
+async def run_batch(worker_id: int, person_ids: list[int]) -> dict[int, bool]:
+    """
+    Обрабатывает пачку людей через LLM: один SELECT, параллельные
+    запросы к LLM по LLM_PARSE_BATCH_SIZE человек (не более max_concurrency клиента одновременно)
+    и один UPDATE на всю пачку.
 
-    except Exception as e:
-        await db.execute(flag_query, False, person_id)
-        logger.exception(f"[Воркер #{worker_id}][person_id={person_id}] ❌ Ошибка в LLM handler: {e}")
-        raise
+    Args:
+        worker_id: ID воркера.
+        person_ids: Список ID людей.
 
-    finally:
-        await db.close()
+    Returns:
+        dict[int, bool]: Результат по каждому найденному person_id.
+    """
+    logger.debug("[Воркер #%s] Запуск LLM handler для пачки из %s человек", worker_id, len(person_ids))
+
+    db = await get_db()
+    llm = get_llm_client()
+
+    persons = await fetch_persons_batch(db, person_ids)
+    inputs = {person_id: build_llm_input(*person_data.values()) for person_id, person_data in persons.items()}
+    results = await parse_persons(llm, inputs, config.LLM_PARSE_BATCH_SIZE, llm.semaphore, worker_id)
+
+    done_ids, first_names, last_names, abouts, valids = [], [], [], [], []
+    failed_ids = []
+    for person_id, llm_input in inputs.items():
+        result = results.get(person_id)
+        if result is None:
+            failed_ids.append(person_id)
+            continue
+        done_ids.append(person_id)
+        first_names.append(result.meaningful_first_name)
+        last_names.append(result.meaningful_last_name)
+        abouts.append(result.meaningful_about)
+        valids.append(is_valid_result(result, llm_input.get('extracted_links')))
+
+    if done_ids:
+        await db.execute(config.UPDATE_LLM_RESULTS_BATCH_QUERY, done_ids, first_names, last_names, abouts, valids)
+    if failed_ids:
+        await db.execute(config.UPDATE_LLM_FLAG_FAILED_BATCH_QUERY, failed_ids)
+        logger.error(f"[Воркер #{worker_id}] ❌ LLM не обработала person_id: {failed_ids}")
+
+    logger.debug("[Воркер #%s] LLM пачка завершена: успешно %s, с ошибкой %s", worker_id, len(done_ids), len(failed_ids))
+    return {person_id: results.get(person_id) is not None for person_id in inputs}
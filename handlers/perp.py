@@ -1,100 +1,68 @@
 import logging
 
 import config
-from llm.perp_client import PerplexityClient
-from utils.db import AsyncDatabaseManager
+from llm.perp_client import get_perp_client
+from utils.db import get_db
 
 logger = logging.getLogger(__name__)
 
 
-async def fetch_person_data(db: AsyncDatabaseManager, person_id: int) -> dict | None:
+async def run(worker_id: int, person_id: int) -> bool:
     """
-    Получает валидные данные человека из базы для поиска Perplexity.
+    Основной обработчик Perplexity для одного человека — обёртка над run_batch.
 
     Args:
-        db: Асинхронный менеджер базы данных.
+        worker_id: ID воркера.
         person_id: ID человека.
 
     Returns:
-        dict | None: Данные человека или None, если человек не найден/невалиден.
+        bool: True, если результат сохранён; False, если человек не найден или невалиден.
     """
-    query = f"""
-        SELECT person_id, meaningful_first_name, meaningful_last_name,
-               meaningful_about, extracted_links
-        FROM {config.result_table_name}
-        WHERE person_id = $1 AND valid = TRUE
-    """
-    rows = await db.fetch(query, person_id)
-    if not rows:
-        logger.warning(f"[person_id={person_id}] ⚠️ Человек не найден или невалиден")
-        return None
-    logger.debug(f"[person_id={person_id}] Данные успешно извлечены из БД")
-    return rows[0]
+    results = await run_batch(worker_id, [person_id])
+    status = results.get(person_id)
+    if status is False:
+        raise Exception(f"Ошибка Perplexity для person_id {person_id}")
+    return bool(status)
 
 
-async def save_perplexity_result(db: AsyncDatabaseManager, person_id: int, summary: str, urls: list, confidence: str) -> None:
+async def run_batch(worker_id: int, person_ids: list[int]) -> dict[int, bool]:
     """
-    Сохраняет результаты поиска Perplexity в базу данных.
+    Perplexity-поиск для пачки людей: один SELECT, параллельные запросы через
+    search_info_batch и один executemany с результатами.
 
     Args:
-        db: Менеджер базы данных.
-        person_id: ID человека.
-        summary: Итоговое summary.
-        urls: Список найденных ссылок.
-        confidence: Уровень доверия ('low', 'medium', 'high').
-    """
-    await db.execute(config.UPDATE_SUMMARY_QUERY, summary, urls, confidence, person_id)
-    await db.execute(f"UPDATE {config.result_table_name} SET flag_perp = TRUE WHERE person_id = $1", person_id)
-    logger.debug(f"[person_id={person_id}] Результаты Perplexity успешно сохранены")
-
-
-async def perform_perplexity_search(perp_client: PerplexityClient, person_data: dict, worker_id: int) -> dict:
-    """
-    Выполняет асинхронный поиск информации через Perplexity для одного человека.
-
-    Args:
-        perp_client: Клиент Perplexity.
-        person_data: Данные человека.
-        worker_id: ID воркера для логирования.
+        worker_id: ID воркера.
+        person_ids: Список ID людей.
 
     Returns:
-        dict: Результат поиска с ключами 'summary', 'urls', 'confidence'.
-    """
-    logger.debug(f"[Воркер #{worker_id}][person_id={person_data['person_id']}] Запуск Perplexity поиска")
-    return await perp_client.search_info(person_data=person_data)
-
-
-async def run(worker_id: int, person_id: int) -> bool:
-    """
-    Основной обработчик Perplexity для одного человека.
-
-    Args:
-        worker_id: ID воркера.
-        person_id: ID человека.
+        dict[int, bool]: True — результат сохранён, False — ошибка поиска.
+        Ненайденные/невалидные люди в результат не попадают.
     """
-    db = AsyncDatabaseManager()
-    await db.connect()
-    perp_client = PerplexityClient()
-
-    try:
-        person_data = await fetch_person_data(db, person_id)
-        if not person_data:
-            return False
-
-        search_result = await perform_perplexity_search(perp_client, person_data, worker_id)
-
-        summary = search_result.get("summary", "")
-        urls = search_result.get("urls", [])
-        confidence = search_result.get("confidence", "заглушка")  # TODO: система confidence
-
-        await save_perplexity_result(db, person_id, summary, urls, confidence)
-        logger.debug(f"[Воркер #{worker_id}][person_id={person_id}] ✅ Perplexity поиск завершен успешно")
-        return True
-
-    except Exception as e:
-        await db.execute(f"UPDATE {config.result_table_name} SET flag_perp = FALSE WHERE person_id = $1", person_id)
-        logger.exception(f"[Воркер #{worker_id}][person_id={person_id}] ❌ Ошибка в Perplexity handler: {e}")
-        raise
-
-    finally:
-        await db.close()
+    logger.debug("[Воркер #%s] Запуск Perplexity поиска для пачки из %s человек", worker_id, len(person_ids))
+
+    db = await get_db()
+    perp_client = get_perp_client()
+
+    rows = await db.fetch(config.SELECT_PERP_BATCH_QUERY, person_ids)
+    search_results = await perp_client.search_info_batch(rows)
+
+    results: dict[int, bool] = {}
+    updates = []
+    for row, search_result in zip(rows, search_results, strict=True):
+        person_id = row["person_id"]
+        if isinstance(search_result, BaseException):
+            logger.error(f"[Воркер #{worker_id}][person_id={person_id}] ❌ Ошибка в Perplexity handler: {search_result}")
+            results[person_id] = False
+            continue
+        results[person_id] = True
+        updates.append((
+            search_result.get("summary", ""),
+            search_result.get("urls", []),
+            search_result.get("confidence", "low"),
+            person_id,
+        ))
+
+    if updates:
+        await db.executemany(config.UPDATE_SUMMARY_QUERY, updates)
+    logger.debug("[Воркер #%s] Perplexity пачка завершена: сохранено %s из %s", worker_id, len(updates), len(rows))
+    return results
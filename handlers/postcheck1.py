@@ -1,55 +1,14 @@
+import asyncio
 import logging
 
 import config
-from llm.llm_client import LlmClient
-from utils.db import AsyncDatabaseManager
+from llm.llm_client import LlmClient, get_llm_client
+from utils.db import get_db
 
 logger = logging.getLogger(__name__)
 
 
-async def fetch_person_for_postcheck1(db: AsyncDatabaseManager, person_id: int) -> dict | None:
-    """
-    Получает данные человека для PostCheck1.
-
-    Args:
-        db: Асинхронный менеджер базы данных.
-        person_id: ID человека.
-
-    Returns:
-        dict | None: Данные человека или None, если человек не найден или Perplexity не выполнен.
-    """
-    query = f"""
-        SELECT person_id, summary, urls, confidence
-        FROM {config.result_table_name}
-        WHERE person_id = $1 AND flag_perp = TRUE
-    """
-    rows = await db.fetch(query, person_id)
-    if not rows:
-        logger.warning(f"[person_id={person_id}] ⚠️ Человек не найден или Perplexity не выполнен")
-        return None
-    logger.debug(f"[person_id={person_id}] Данные для PostCheck1 успешно извлечены")
-    return rows[0]
-
-
-async def save_postcheck1_result(db: AsyncDatabaseManager, person_id: int, success: bool) -> None:
-    """
-    Сохраняет результат первой проверки summary через LLM.
-
-    Args:
-        db: Асинхронный менеджер базы данных.
-        person_id: ID человека.
-        success: True, если проверка успешна, False в случае ошибки.
-    """
-    query = f"UPDATE {config.result_table_name} SET flag_postcheck1 = $1"
-    if not success:
-        query += ", done = FALSE"
-    query += " WHERE person_id = $2"
-
-    await db.execute(query, success, person_id)
-    logger.debug(f"[person_id={person_id}] Результат PostCheck1 сохранен: {success}")
-
-
-async def perform_postcheck1(llm_client: LlmClient, summary: str, worker_id: int, person_id: int) -> bool:
+async def perform_postcheck1(llm_client: LlmClient, summary: str | None, worker_id: int, person_id: int) -> bool:
     """
     Выполняет асинхронную проверку summary через LLM.
 
@@ -60,42 +19,71 @@ async def perform_postcheck1(llm_client: LlmClient, summary: str, worker_id: int
         person_id: ID человека.
 
     Returns:
-        bool: True, если summary валиден, False — если нет.
+        bool: True, если summary валиден, False — если нет (пустой summary в LLM не отправляется).
     """
-    logger.debug(f"[Воркер #{worker_id}][person_id={person_id}] Запуск проверки PostCheck1")
+    if not summary or not summary.strip():
+        logger.debug("[Воркер #%s][person_id=%s] Пустой summary, PostCheck1 пропущен", worker_id, person_id)
+        return False
+    logger.debug("[Воркер #%s][person_id=%s] Запуск проверки PostCheck1", worker_id, person_id)
     return await llm_client.async_postcheck(summary)
 
 
 async def run(worker_id: int, person_id: int) -> bool:
     """
-    Основной обработчик PostCheck1 для одного человека.
+    Основной обработчик PostCheck1 для одного человека — обёртка над run_batch.
 
     Args:
         worker_id: ID воркера.
         person_id: ID человека.
-    """
-    logger.debug(f"[Воркер #{worker_id}][person_id={person_id}] Начинаем PostCheck1")
-
-    db = AsyncDatabaseManager()
-    await db.connect()
-    llm_client = LlmClient()
 
-    try:
-        person_data = await fetch_person_for_postcheck1(db, person_id)
-        if not person_data:
-            return False
+    Returns:
+        bool: True, если summary валиден.
+    """
+    results = await run_batch(worker_id, [person_id])
+    status = results.get(person_id)
+    if status is False:
+        raise Exception(f"Ошибка PostCheck1 для person_id {person_id}")
+    return bool(status)
 
-        summary = person_data.get("summary", "")
-        is_valid = await perform_postcheck1(llm_client, summary, worker_id, person_id)
 
-        await save_postcheck1_result(db, person_id, is_valid)
-        logger.debug(f"[Воркер #{worker_id}][person_id={person_id}] ✅ PostCheck1 завершен. Валидность: {is_valid}")
-        return is_valid
+async def run_batch(worker_id: int, person_ids: list[int]) -> dict[int, bool]:
+    """
+    PostCheck1 для пачки людей: один SELECT, параллельные проверки (не более
+    max_concurrency клиента одновременно) и один executemany с вердиктами.
 
-    except Exception as e:
-        await save_postcheck1_result(db, person_id, False)
-        logger.exception(f"[Воркер #{worker_id}][person_id={person_id}] ❌ Ошибка в PostCheck1 handler: {e}")
-        raise
+    Args:
+        worker_id: ID воркера.
+        person_ids: Список ID людей.
 
-    finally:
-        await db.close()
+    Returns:
+        dict[int, bool]: True — summary валиден, False — ошибка проверки.
+        Люди с невалидным summary в результат не попадают (задача выполнена, следующей нет).
+    """
+    logger.debug("[Воркер #%s] Запуск PostCheck1 для пачки из %s человек", worker_id, len(person_ids))
+
+    db = await get_db()
+    llm_client = get_llm_client()
+
+    async def check(person_id: int, summary: str | None) -> bool:
+        async with llm_client.semaphore:
+            return await perform_postcheck1(llm_client, summary, worker_id, person_id)
+
+    rows = await db.fetch(config.SELECT_POSTCHECK1_BATCH_QUERY, person_ids)
+    verdicts = await asyncio.gather(*(check(row["person_id"], row["summary"]) for row in rows), return_exceptions=True)
+
+    results: dict[int, bool] = {}
+    updates = []
+    for row, verdict in zip(rows, verdicts, strict=True):
+        person_id = row["person_id"]
+        if isinstance(verdict, BaseException):
+            logger.error(f"[Воркер #{worker_id}][person_id={person_id}] ❌ Ошибка в PostCheck1: {verdict}")
+            results[person_id] = False
+            verdict = False
+        elif verdict:
+            results[person_id] = True
+        updates.append((verdict, person_id))
+
+    if updates:
+        await db.executemany(config.UPDATE_POSTCHECK1_RESULT_QUERY, updates)
+    logger.debug("[Воркер #%s] PostCheck1 пачка завершена: %s человек", worker_id, len(updates))
+    return results
@@ -1,59 +1,14 @@
+import asyncio
 import logging
 
 import config
-from llm.llm_client import LlmClient
-from utils.db import AsyncDatabaseManager
+from llm.llm_client import LlmClient, get_llm_client
+from utils.db import get_db
 
 logger = logging.getLogger(__name__)
 
 
-async def fetch_person_for_postcheck2(db: AsyncDatabaseManager, person_id: int) -> dict | None:
-    """
-    Получает данные человека для PostCheck2.
-
-    Args:
-        db: Асинхронный менеджер базы данных.
-        person_id: ID человека.
-
-    Returns:
-        dict | None: Данные человека или None, если человек не найден
-                     или PostCheck1 не выполнен.
-    """
-    query = f"""
-        SELECT person_id, meaningful_first_name, meaningful_last_name,
-               meaningful_about, extracted_links, summary, urls, confidence
-        FROM {config.result_table_name}
-        WHERE person_id = $1 AND flag_postcheck1 = TRUE
-    """
-    rows = await db.fetch(query, person_id)
-    if not rows:
-        logger.warning(f"[person_id={person_id}] ⚠️ Человек не найден или PostCheck1 не выполнен")
-        return None
-    logger.debug(f"[person_id={person_id}] Данные для PostCheck2 успешно извлечены")
-    return rows[0]
-
-
-async def save_postcheck2_result(db: AsyncDatabaseManager, person_id: int, success: bool) -> None:
-    """
-    Сохраняет результат второй проверки summary через LLM.
-
-    Args:
-        db: Асинхронный менеджер базы данных.
-        person_id: ID человека.
-        success: True, если проверка успешна, False — если нет.
-    """
-    query = f"UPDATE {config.result_table_name} SET flag_postcheck2 = $1"
-    if success:
-        query += ", done = TRUE"
-    else:
-        query += ", done = FALSE"
-    query += " WHERE person_id = $2"
-
-    await db.execute(query, success, person_id)
-    logger.debug(f"[person_id={person_id}] Результат PostCheck2 сохранен: {success}")
-
-
-async def perform_postcheck2(llm_client: LlmClient, person_data: dict, summary: str, urls: list, worker_id: int, person_id: int) -> bool:
+async def perform_postcheck2(llm_client: LlmClient, person_data: dict, summary: str | None, urls: list, worker_id: int, person_id: int) -> bool:
     """
     Выполняет асинхронную проверку summary через LLM с контекстом персоны.
 
@@ -66,44 +21,74 @@ async def perform_postcheck2(llm_client: LlmClient, person_data: dict, summary:
         person_id: ID человека.
 
     Returns:
-        bool: True, если summary валиден, False в противном случае.
+        bool: True, если summary валиден, False в противном случае (пустой summary в LLM не отправляется).
     """
-    logger.debug(f"[Воркер #{worker_id}][person_id={person_id}] Запуск проверки PostCheck2")
+    if not summary or not summary.strip():
+        logger.debug("[Воркер #%s][person_id=%s] Пустой summary, PostCheck2 пропущен", worker_id, person_id)
+        return False
+    logger.debug("[Воркер #%s][person_id=%s] Запуск проверки PostCheck2", worker_id, person_id)
     return await llm_client.async_postcheck2(person_data, summary, urls)
 
 
 async def run(worker_id: int, person_id: int) -> bool:
     """
-    Основной обработчик PostCheck2 для одного человека.
+    Основной обработчик PostCheck2 для одного человека — обёртка над run_batch.
 
     Args:
         worker_id: ID воркера.
         person_id: ID человека.
-    """
-    logger.debug(f"[Воркер #{worker_id}][person_id={person_id}] Начинаем PostCheck2")
-
-    db = AsyncDatabaseManager()
-    await db.connect()
-    llm_client = LlmClient()
-
-    try:
-        person_data = await fetch_person_for_postcheck2(db, person_id)
-        if not person_data:
-            return False
 
-        summary = person_data.get("summary", "")
-        urls = person_data.get("urls", [])
+    Returns:
+        bool: True, если summary валиден.
+    """
+    results = await run_batch(worker_id, [person_id])
+    status = results.get(person_id)
+    if status is False:
+        raise Exception(f"Ошибка PostCheck2 для person_id {person_id}")
+    return bool(status)
 
-        is_valid = await perform_postcheck2(llm_client, person_data, summary, urls, worker_id, person_id)
 
-        await save_postcheck2_result(db, person_id, is_valid)
-        logger.debug(f"[Воркер #{worker_id}][person_id={person_id}] ✅ PostCheck2 завершен. Валидность: {is_valid}")
-        return is_valid
+async def run_batch(worker_id: int, person_ids: list[int]) -> dict[int, bool]:
+    """
+    PostCheck2 для пачки людей: один SELECT, параллельные проверки (не более
+    max_concurrency клиента одновременно) и один executemany с вердиктами.
 
-    except Exception as e:
-        await save_postcheck2_result(db, person_id, False)
-        logger.exception(f"[Воркер #{worker_id}][person_id={person_id}] ❌ Ошибка в PostCheck2 handler: {e}")
-        raise
+    Args:
+        worker_id: ID воркера.
+        person_ids: Список ID людей.
 
-    finally:
-        await db.close()
+    Returns:
+        dict[int, bool]: True — summary валиден, False — ошибка проверки.
+        Люди с невалидным summary в результат не попадают (задача выполнена, следующей нет).
+    """
+    logger.debug("[Воркер #%s] Запуск PostCheck2 для пачки из %s человек", worker_id, len(person_ids))
+
+    db = await get_db()
+    llm_client = get_llm_client()
+
+    async def check(person_data: dict) -> bool:
+        async with llm_client.semaphore:
+            return await perform_postcheck2(
+                llm_client, person_data, person_data.get("summary", ""), person_data.get("urls", []),
+                worker_id, person_data["person_id"]
+            )
+
+    rows = await db.fetch(config.SELECT_POSTCHECK2_BATCH_QUERY, person_ids)
+    verdicts = await asyncio.gather(*(check(row) for row in rows), return_exceptions=True)
+
+    results: dict[int, bool] = {}
+    updates = []
+    for row, verdict in zip(rows, verdicts, strict=True):
+        person_id = row["person_id"]
+        if isinstance(verdict, BaseException):
+            logger.error(f"[Воркер #{worker_id}][person_id={person_id}] ❌ Ошибка в PostCheck2: {verdict}")
+            results[person_id] = False
+            verdict = False
+        elif verdict:
+            results[person_id] = True
+        updates.append((verdict, person_id))
+
+    if updates:
+        await db.executemany(config.UPDATE_POSTCHECK2_RESULT_QUERY, updates)
+    logger.debug("[Воркер #%s] PostCheck2 пачка завершена: %s человек", worker_id, len(updates))
+    return results
@@ -1,13 +1,28 @@
+import asyncio
 import logging
+from dataclasses import dataclass
 
+import asyncpg
 import config
 from utils import cleaner
-from utils.db import AsyncDatabaseManager
+from utils.db import AsyncDatabaseManager, get_db
 
 logger = logging.getLogger(__name__)
 
 
-async def fetch_person(db: AsyncDatabaseManager, person_id: int) -> dict | None:
+@dataclass(slots=True)
+class NormalizedPerson:
+    """Поля персоны после normalize_empty."""
+
+    person_id: int
+    first_name: str | None
+    last_name: str | None
+    about: str | None
+    personal_channel_title: str | None
+    personal_channel_about: str | None
+
+
+async def fetch_person(db: AsyncDatabaseManager, person_id: int) -> asyncpg.Record | None:
     """
     Получает данные конкретного человека из базы данных.
 
@@ -16,53 +31,53 @@ async def fetch_person(db: AsyncDatabaseManager, person_id: int) -> dict | None:
         person_id: ID персоны.
 
     Returns:
-        dict | None: Словарь с данными персоны или None, если не найдено.
+        asyncpg.Record | None: Строка с данными персоны или None, если не найдено.
     """
-    query = f"""
-        SELECT person_id, first_name, last_name, about,
-               personal_channel_title, personal_channel_about
-        FROM {config.result_table_name}
-        WHERE person_id = $1
-    """
-    rows = await db.fetch(query, person_id)
-    if not rows:
+    row = await db.fetchrow(config.SELECT_PRELLM_ROW_QUERY, person_id)
+    if row is None:
         logger.warning(f"[person_id={person_id}] ⚠️ Не найден в БД")
         return None
-    return rows[0]
+    return row
 
 
-def normalize_person_fields(person: dict) -> None:
+def normalize_person_fields(person: asyncpg.Record) -> NormalizedPerson:
     """
     Приводит поля персоны к нормализованной форме.
 
     Args:
-        person: Словарь с данными персоны.
+        person: Строка SELECT_PRELLM_ROW_QUERY (колонки в порядке полей NormalizedPerson).
+
+    Returns:
+        NormalizedPerson: person_id и нормализованные поля.
     """
-    fields_to_normalize = [
-        'first_name', 'last_name',
-        'about', 'personal_channel_title',
-        'personal_channel_about'
-    ]
-    for field in fields_to_normalize:
-        person[field] = cleaner.normalize_empty(person.get(field))
-    logger.debug(f"[person_id={person.get('person_id')}] Поля нормализованы")
+    normalize = cleaner.normalize_empty
+    person_id, first_name, last_name, about, channel_title, channel_about = person
+    logger.debug("[person_id=%s] Поля нормализованы", person_id)
+    return NormalizedPerson(
+        person_id,
+        normalize(first_name),
+        normalize(last_name),
+        normalize(about),
+        normalize(channel_title),
+        normalize(channel_about),
+    )
 
 
-def extract_meaningful_data(person: dict) -> tuple[str | None, str | None, str | None, list[str]]:
+def extract_meaningful_data(person: NormalizedPerson) -> tuple[str | None, str | None, str | None, list[str]]:
     """
     Извлекает и очищает meaningful-поля для LLM.
 
     Args:
-        person: Словарь с данными персоны.
+        person: Нормализованные данные персоны.
 
     Returns:
         tuple: first_name, last_name, about_clean, extracted_links
     """
-    first_name = cleaner.clean_name_field(person.get('first_name'))
-    last_name = cleaner.clean_second_name_field(person.get('last_name'))
-    about = person.get('about')
-    channel_title = person.get('personal_channel_title')
-    channel_about = person.get('personal_channel_about')
+    first_name = cleaner.clean_name_field(person.first_name)
+    last_name = cleaner.clean_second_name_field(person.last_name)
+    about = person.about
+    channel_title = person.personal_channel_title
+    channel_about = person.personal_channel_about
 
     if first_name and ' ' in first_name and not last_name:
         parts = first_name.split(' ', 1)
@@ -73,13 +88,17 @@ def extract_meaningful_data(person: dict) -> tuple[str | None, str | None, str |
     extracted_links = cleaner.extract_links(last_name, about, channel_about)
 
     logger.debug(
-        f"[person_id={person.get('person_id')}] "
-        f"first_name={first_name}, last_name={last_name}, "
-        f"about_clean={'Есть' if about_clean else 'None'}, links_count={len(extracted_links)}"
+        "[person_id=%s] first_name=%s, last_name=%s, about_clean=%s, links_count=%s",
+        person.person_id, first_name, last_name, 'Есть' if about_clean else 'None', len(extracted_links)
     )
     return first_name, last_name, about_clean, extracted_links
 
 
+def prepare_meaningful_data(person: asyncpg.Record) -> tuple[str | None, str | None, str | None, list[str]]:
+    """Нормализация и очистка полей одной персоны — синхронная CPU-часть prellm."""
+    return extract_meaningful_data(normalize_person_fields(person))
+
+
 async def update_meaningful_fields(
     db: AsyncDatabaseManager,
     person_id: int,
@@ -100,10 +119,6 @@ async def update_meaningful_fields(
         extracted_links: Список ссылок.
     """
     await db.execute(config.UPDATE_MEANINGFUL_FIELDS_QUERY, first_name, last_name, about_clean, extracted_links, person_id)
-    await db.execute(
-        f"UPDATE {config.result_table_name} SET flag_prellm = TRUE WHERE person_id = $1",
-        person_id
-    )
     # logger.debug(f"[person_id={person_id}] Поля meaningful обновлены и flag_prellm установлен")
 
 
@@ -117,26 +132,20 @@ async def run(worker_id: int, person_id: int) -> bool:
     """
     # logger.debug(f"[Воркер #{worker_id}][person_id={person_id}] Начинаем prellm")
 
-    db = AsyncDatabaseManager()
-    await db.connect()
+    db = await get_db()
 
     try:
         person = await fetch_person(db, person_id)
         if not person:
             return False
 
-        normalize_person_fields(person)
-        first_name, last_name, about_clean, extracted_links = extract_meaningful_data(person)
+        # Очистка в отдельном потоке, чтобы regex/translate не задерживали остальные корутины
+        first_name, last_name, about_clean, extracted_links = await asyncio.to_thread(prepare_meaningful_data, person)
         await update_meaningful_fields(db, person_id, first_name, last_name, about_clean, extracted_links)
         return True
         # logger.debug(f"[Воркер #{worker_id}][person_id={person_id}] ✅ prellm завершен успешно")
 
     except Exception as e:
         logger.exception(f"[Воркер #{worker_id}][person_id={person_id}] ❌ Ошибка prellm: {e}")
-        await db.execute(
-            f"UPDATE {config.result_table_name} SET flag_prellm = FALSE WHERE person_id = $1",
-            person_id
-        )
+        await db.execute(config.UPDATE_PRELLM_FLAG_FAILED_QUERY, person_id)
         raise
-    finally:
-        await db.close()
@@ -1,22 +1,90 @@
-import json
+import asyncio
 import logging
-from typing import Any
+from collections.abc import AsyncIterator
+from typing import Any, ClassVar
 
+import httpx
 from config import PATH_PROMPTS, LlmConfig, LlmResponse
-from jinja2 import Environment, FileSystemLoader
-from openai import AsyncOpenAI
+from jinja2 import Environment, FileSystemLoader, Template
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+from utils import jsonlib
+
+# Общие значения response_format: не собираем словарь на каждый запрос
+RF_JSON = {"type": "json_object"}
+RF_TEXT = {"type": "text"}
+
+
+class LlmRequestError(Exception):
+    """Запрос к LLM не выполнен (сеть, 5xx): повторы SDK уже исчерпаны."""
+
+
+_http_client: httpx.AsyncClient | None = None
+# Сколько клиентов (LlmClient, PerplexityClient) делят общий HTTP-пул: каждый держит
+# до max_concurrency запросов, и пул не должен резать этот лимит
+_HTTP_POOL_CLIENTS = 2
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Возвращает общий для процесса HTTP-клиент с keep-alive пулом соединений."""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        pool_size = LlmConfig().max_concurrency * _HTTP_POOL_CLIENTS
+        _http_client = DefaultAsyncHttpxClient(
+            limits=httpx.Limits(
+                max_connections=pool_size,
+                max_keepalive_connections=pool_size,
+                keepalive_expiry=60,
+            )
+        )
+    return _http_client
+
+
+async def close_http_client() -> None:
+    """Закрывает общий HTTP-клиент и его keep-alive соединения (при завершении работы)."""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+        BaseLLMClient.clear_clients()
 
 
 class PromptRenderer:
+    # Environment и скомпилированные шаблоны (по имени) общие для всех клиентов с одним каталогом промптов
+    _environments: ClassVar[dict[str, Environment]] = {}
+    _templates: ClassVar[dict[str, dict[str, Template]]] = {}
+
     def __init__(self, path: str):
-        self.env = Environment(
-            loader=FileSystemLoader(path),
-            autoescape=True
-        )
+        self.path = path
+        is_new = path not in self._environments
+        if is_new:
+            # Промпты не меняются во время работы: без auto_reload нет stat файла на каждый вызов
+            self._environments[path] = Environment(
+                loader=FileSystemLoader(path),
+                autoescape=True,
+                auto_reload=False,
+                cache_size=400,
+            )
+            self._templates[path] = {}
+        self.env = self._environments[path]
+        self.templates = self._templates[path]
+        if is_new:
+            self.preload()
+
+    def preload(self) -> None:
+        """Компилирует все шаблоны каталога заранее, чтобы первый запрос не ждал загрузки."""
+        for name in self.env.list_templates(extensions=["jinja2"]):
+            self.get_template(name.removesuffix(".jinja2"))
+
+    def get_template(self, template: str) -> Template:
+        t = self.templates.get(template)
+        if t is None:
+            t = self.templates[template] = self.env.get_template(f"{template}.jinja2")
+        return t
 
     def render(self, template: str, **kwargs) -> str:
         try:
-            t = self.env.get_template(f"{template}.jinja2")
+            # Все шаблоны каталога скомпилированы в preload — обычно это один поиск в словаре
+            t = self.templates.get(template) or self.get_template(template)
             return t.render(**kwargs)
         except Exception as e:
             raise RuntimeError(f"Ошибка рендеринга шаблона '{template}': {e}") from e
@@ -25,22 +93,45 @@ class PromptRenderer:
 class BaseLLMClient:
     """Базовый async-клиент для OpenAI/OpenRouter."""
 
-    def __init__(self, config: LlmConfig | None = None):
+    # AsyncOpenAI на общем HTTP-клиенте переиспользуется всеми экземплярами с одинаковыми (url, key, max_retries)
+    _clients: ClassVar[dict[tuple[str, str | None, int], AsyncOpenAI]] = {}
+    # Логгер на уровне класса: не создаётся и не ищется заново для каждого экземпляра
+    logger: ClassVar[logging.Logger] = logging.getLogger(__name__)
+
+    def __init__(self, config: LlmConfig | None = None, http_client: httpx.AsyncClient | None = None):
         self.config = config or LlmConfig()
-        self.logger = logging.getLogger(__name__)
 
+        self._http_client = http_client
         self._client: AsyncOpenAI | None = None
+        # Общий лимит одновременных запросов клиента: через него идут все пакетные обработчики
+        self.semaphore = asyncio.Semaphore(self.config.max_concurrency)
         self.prompts = PromptRenderer(PATH_PROMPTS)
 
     @property
     def client(self) -> AsyncOpenAI:
-        if self._client is None:
-            self._client = AsyncOpenAI(
-                base_url=self.config.url,
-                api_key=self.config.key,
-            )
+        if self._client is None or self._client.is_closed():
+            if self._http_client is not None:
+                self._client = self._create_client(self._http_client)
+            else:
+                key = (self.config.url, self.config.key, self.config.max_retries)
+                if key not in self._clients:
+                    self._clients[key] = self._create_client(get_http_client())
+                self._client = self._clients[key]
         return self._client
 
+    @classmethod
+    def clear_clients(cls) -> None:
+        """Забывает общие AsyncOpenAI — после закрытия HTTP-клиента, на котором они построены."""
+        cls._clients.clear()
+
+    def _create_client(self, http_client: httpx.AsyncClient) -> AsyncOpenAI:
+        return AsyncOpenAI(
+            base_url=self.config.url,
+            api_key=self.config.key,
+            http_client=http_client,
+            max_retries=self.config.max_retries,
+        )
+
     async def request(
         self,
         prompt: str,
@@ -53,6 +144,7 @@ class BaseLLMClient:
         extra_body: dict | None = None,
     ) -> LlmResponse:
         model = model or self.config.model["default"]
+        json_mode = response_format == RF_JSON
         try:
             # messages = [
             #     {"role": "system", "content": "You are a helpful research assistant."},
@@ -72,27 +164,55 @@ class BaseLLMClient:
 
             msg = completion.choices[0].message
             raw_text = msg.content if msg else None
-            data_json = self._parse_json(raw_text) if response_format == {"type": "json_object"} else None
+            data_json = self._parse_json(raw_text) if json_mode else None
             return LlmResponse(
                 text=raw_text,
                 json=data_json,
                 raw=completion,
-                usage=getattr(completion, "usage", None),
+                usage=completion.usage,
             )
 
         except Exception as exc:
             self.logger.error("Ошибка LLM запроса", exc_info=exc)
             return LlmResponse(
                 text=None,
-                json={} if response_format == {"type": "json_object"} else None,
+                json={} if json_mode else None,
                 raw=None,
                 usage=None,
             )
 
+    async def stream(
+        self,
+        prompt: str,
+        model: str | None = None,
+        *,
+        response_format: dict | None = None,
+        temperature: float | None = None,
+    ) -> AsyncIterator[str]:
+        """
+        Потоковый запрос: отдаёт фрагменты текста ответа по мере генерации.
+
+        Если вызывающий перестаёт читать раньше (закрывает генератор), HTTP-ответ закрывается
+        и генерация на стороне провайдера прерывается. Ошибки запроса пробрасываются.
+        """
+        completion = await self.client.chat.completions.create(
+            messages=[{"role": "user", "content": prompt}],
+            model=model or self.config.model["default"],
+            response_format=response_format,
+            temperature=temperature,
+            stream=True,
+        )
+        try:
+            async for chunk in completion:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            await completion.close()
+
     def _parse_json(self, raw: str | None) -> dict[str, Any]:
         if not raw: return {}
         try:
-            parsed = json.loads(raw)
+            parsed = jsonlib.loads(raw)
             return parsed if isinstance(parsed, dict) else {"result": parsed}
         except Exception as exc:
             self.logger.warning("Ошибка JSON", exc_info=exc, extra={"raw": raw})
@@ -1,14 +1,38 @@
+import re
+from contextlib import aclosing
 from typing import Any
 
-from config import LlmConfig
-from llm.base_llm_client import BaseLLMClient, LlmResponse
+import httpx
+from config import LLM_CACHE_ENABLED, LlmConfig
+from llm.base_llm_client import RF_JSON, BaseLLMClient, LlmRequestError, LlmResponse
+from llm.response_cache import LlmResponseCache, response_cache_key
+from pydantic import BaseModel, ValidationError
+from utils import jsonlib
+
+# Значение is_valid распознаётся в ещё не завершённом JSON (промпт допускает и True/False)
+_VERDICT_PATTERN = re.compile(r'"is_valid"\s*:\s*(true|false)', re.IGNORECASE)
+
+
+class MeaningfulFields(BaseModel):
+    """Ответ LLM на parse_single. Все поля обязательны, но могут быть null."""
+
+    meaningful_first_name: str | None
+    meaningful_last_name: str | None
+    meaningful_about: str | None
+
+
+class Verdict(BaseModel):
+    """Ответ LLM на postcheck/postcheck2."""
+
+    is_valid: bool
 
 
 class LlmClient(BaseLLMClient):
     """Клиент для обычных LLM-вызовов."""
 
-    def __init__(self, config: LlmConfig | None = None) -> None:
-        super().__init__(config=config)
+    def __init__(self, config: LlmConfig | None = None, http_client: httpx.AsyncClient | None = None) -> None:
+        super().__init__(config=config, http_client=http_client)
+        self.cache = LlmResponseCache() if LLM_CACHE_ENABLED else None
 
     async def ask_json(
         self,
@@ -21,17 +45,108 @@ class LlmClient(BaseLLMClient):
         response: LlmResponse = await self.request(
             prompt=prompt,
             model=model,
-            response_format={"type": "json_object"},
+            response_format=RF_JSON,
             temperature=temperature,
         )
         return response.json or {}
 
-    async def async_parse_single_to_meaningful(self, person_data: dict) -> dict:
+    async def ask_verdict(self, prompt: str, *, model: str, template: str) -> bool:
+        """
+        Получает вердикт {"is_valid": ...} с temperature=0.
+
+        Ответ читается потоком, и запрос прерывается, как только значение is_valid распознано, —
+        остаток JSON (пояснения модели) не ждём. Вердикт кэшируется по промпту.
+        """
+        key = response_cache_key(model, template, prompt) if self.cache is not None else None
+        if key is not None:
+            cached = await self.cache.get(key)
+            if cached is not None:
+                return bool(cached.get("is_valid"))
+
+        text = ""
+        verdict: bool | None = None
+        try:
+            async with aclosing(self.stream(prompt, model, response_format=RF_JSON, temperature=0.0)) as deltas:
+                async for delta in deltas:
+                    text += delta
+                    match = _VERDICT_PATTERN.search(text)
+                    if match:
+                        verdict = match.group(1).lower() == "true"
+                        break
+        except Exception as exc:
+            self.logger.error("Ошибка LLM запроса", exc_info=exc)
+            return False
+
+        if verdict is None:
+            # Поток кончился без распознанного is_valid: проверяем ответ локально по схеме,
+            # без повторного запроса. Некорректный ответ не кэшируем.
+            try:
+                verdict = Verdict.model_validate(self._parse_json(text)).is_valid
+            except ValidationError as exc:
+                self.logger.warning("Ответ без корректного is_valid", exc_info=exc, extra={"raw": text})
+                return False
+
+        if key is not None:
+            await self.cache.set(key, {"is_valid": verdict})
+        return verdict
+
+    async def _ask_parse_json(self, prompt: str) -> dict[str, Any]:
+        """
+        JSON-ответ модели default для парсинга meaningful-полей.
+
+        В отличие от ask_json, отказ запроса отличается от плохого ответа: при отказе
+        поднимается LlmRequestError, чтобы вызывающий не повторял запрос поверх повторов SDK.
+        """
+        response: LlmResponse = await self.request(
+            prompt=prompt,
+            model=self.config.model["default"],
+            response_format=RF_JSON,
+            temperature=0.0,
+        )
+        if response.raw is None:
+            raise LlmRequestError("LLM-запрос парсинга не выполнен")
+        return response.json or {}
+
+    async def async_parse_single_to_meaningful(self, person_data: dict) -> MeaningfulFields:
         """
         Обрабатывает данные одного человека через LLM.
+
+        Raises:
+            LlmRequestError: если запрос не выполнен — повторять его бессмысленно, SDK уже повторял.
+            pydantic.ValidationError: если ответ пустой или не соответствует схеме.
         """
         prompt = self.prompts.render("parse_single", person_data=person_data)
-        return await self.ask_json(prompt, model=self.config.model["default"], temperature=0.0)
+        return MeaningfulFields.model_validate(await self._ask_parse_json(prompt))
+
+    async def async_parse_batch_to_meaningful(self, people: list[dict]) -> dict[int, MeaningfulFields]:
+        """
+        Обрабатывает данные нескольких людей одним запросом к LLM.
+
+        Ответ сопоставляется с входом по person_id. Люди, для которых модель не вернула
+        корректный результат, в ответ не попадают — их нужно переспросить.
+
+        Returns:
+            dict[int, MeaningfulFields]: Результаты по person_id.
+
+        Raises:
+            LlmRequestError: если запрос не выполнен (сеть, 5xx).
+        """
+        prompt = self.prompts.render("parse_chunk", chunk_json=jsonlib.dumps(people))
+        response = await self._ask_parse_json(prompt)
+
+        requested = {person["person_id"] for person in people}
+        results: dict[int, MeaningfulFields] = {}
+        items = response.get("results")
+        for item in items if isinstance(items, list) else []:
+            try:
+                person_id = int(item["person_id"])
+                fields = MeaningfulFields.model_validate(item)
+            except (KeyError, TypeError, ValueError, ValidationError) as exc:
+                self.logger.debug("Пропущен некорректный элемент пачки %r: %s", item, exc)
+                continue
+            if person_id in requested:
+                results[person_id] = fields
+        return results
 
     async def async_postcheck(self, text: str) -> bool:
         """Проверка результата моделью check."""
@@ -39,17 +154,17 @@ class LlmClient(BaseLLMClient):
         if not prompt:
             return False
 
-        response = await self.ask_json(prompt, model=self.config.model["check"], temperature=0.0)
-        return bool(response.get("is_valid"))
+        return await self.ask_verdict(prompt, model=self.config.model["check"], template="postcheck")
 
     async def async_postcheck2(self, person: dict, summary: str, urls) -> bool:
         """Расширенная проверка результата моделью check."""
-        pieces = [
-            f"- Имя: {person.get('meaningful_first_name', '')}",
-            f"- Фамилия: {person.get('meaningful_last_name', '')}",
-            f"- Доп. информация: {person.get('meaningful_about', '')}",
-            f"- Ссылки, названия: {person.get('extracted_links', [])}",
-        ]
+        get = person.get
+        pieces = (
+            f"- Имя: {get('meaningful_first_name', '')}\n"
+            f"- Фамилия: {get('meaningful_last_name', '')}\n"
+            f"- Доп. информация: {get('meaningful_about', '')}\n"
+            f"- Ссылки, названия: {get('extracted_links', [])}"
+        )
 
         prompt = self.prompts.render(
             "postcheck2",
@@ -61,5 +176,15 @@ class LlmClient(BaseLLMClient):
         if not prompt:
             return False
 
-        response = await self.ask_json(prompt, model=self.config.model["check"], temperature=0.0)
-        return bool(response.get("is_valid"))
+        return await self.ask_verdict(prompt, model=self.config.model["check"], template="postcheck2")
+
+
+_llm_client: LlmClient | None = None
+
+
+def get_llm_client() -> LlmClient:
+    """Возвращает общий для процесса экземпляр LlmClient."""
+    global _llm_client
+    if _llm_client is None:
+        _llm_client = LlmClient()
+    return _llm_client
@@ -1,87 +1,197 @@
+import asyncio
+import hashlib
 import logging
-from typing import Any
+from typing import Any, ClassVar
 
-from config import LlmConfig
-from llm.base_llm_client import BaseLLMClient, LlmResponse
+import httpx
+from config import LLM_CACHE_ENABLED, PERP_CACHE_MAX_AGE, LlmConfig
+from llm.base_llm_client import RF_TEXT, BaseLLMClient, LlmResponse
+from llm.response_cache import LlmResponseCache, response_cache_key
+from utils import jsonlib
+
+# OSINT-настройки запроса для perp. Собираются один раз и передаются в каждый запрос
+# по ссылке: ни клиент, ни SDK их не изменяют.
+_OSINT_PARAMS: dict[str, Any] = {
+    "top_p": 0.9,
+    "presence_penalty": 0.3,
+    "frequency_penalty": 0.2,
+    "web_search_options": {
+        "search_context_size": "high",  # medium low
+        "include_domains": None,
+    },
+    "search_language_filter": ["en", "ru"],
+    "return_related_questions": False,
+    "search_mode": "web",
+    "max_tokens_per_page": 150,
+    "num_search_results": None,
+    "return_images": True,
+    "image_format_filter": ["gif", "jpg", "png", "webp"],
+}
+
+
+def _citation_url(annotation: Any) -> str | None:
+    """URL цитаты из аннотации ответа или None, если у аннотации нет url_citation/url."""
+    try:
+        return annotation.url_citation.url
+    except AttributeError:
+        return None
 
 
 class PerplexityClient(BaseLLMClient):
     """Клиент для работы с Perplexity моделями."""
 
-    def __init__(self, config: LlmConfig | None = None) -> None:
-        super().__init__(config=config)
-        self.logger = logging.getLogger(__name__)
+    logger: ClassVar[logging.Logger] = logging.getLogger(__name__)
+
+    def __init__(self, config: LlmConfig | None = None, http_client: httpx.AsyncClient | None = None) -> None:
+        super().__init__(config=config, http_client=http_client)
+        self.cache = LlmResponseCache(max_age=PERP_CACHE_MAX_AGE) if LLM_CACHE_ENABLED else None
+        self._search_template = self.prompts.get_template("perp_search")
+        self._model = self.config.model["perplexity"]
+        # Версия шаблона в ключе кэша: правка промпта не отдаёт ответы на старый промпт
+        source = self.prompts.env.loader.get_source(self.prompts.env, "perp_search.jinja2")[0]
+        self._cache_namespace = "perp_search:" + hashlib.sha256(source.encode()).hexdigest()[:16]
 
     async def search_info(self, person_data: dict) -> dict:
-        """Ищет информацию о человеке через Perplexity."""
-        pieces = self._build_search_pieces(person_data)
-        prompt = self.prompts.render("perp_search", pieces=pieces)
+        """
+        Ищет информацию о человеке через Perplexity.
+
+        Результат кэшируется в БД (PERP_CACHE_MAX_AGE) по нормализованным данным человека:
+        повторный поиск с теми же данными (дубликаты персон, перезапуск пайплайна,
+        отличия только в регистре, пробелах или порядке ссылок) не уходит в сеть.
+        Пустые ответы не кэшируются. Без имени и фамилии искать некого — запрос не отправляется.
+        """
+        first_name, last_name = person_data.get("meaningful_first_name"), person_data.get("meaningful_last_name")
+        if not ((first_name and first_name.strip()) or (last_name and last_name.strip())):
+            return {"summary": None, "urls": [], "confidence": "low"}
+
+        key = (
+            response_cache_key(self._model, self._cache_namespace, self._canonical_person_key(person_data))
+            if self.cache is not None else None
+        )
+        if key is not None:
+            cached = await self.cache.get(key)
+            if cached is not None:
+                summary, urls = cached.get("summary"), cached.get("urls") or []
+                return {"summary": summary, "urls": urls, "confidence": self._estimate_confidence(summary, urls)}
+
+        prompt = self._search_template.render(pieces=self._build_search_pieces(person_data))
         response: LlmResponse = await self.request(
             prompt=prompt,
-            model=self.config.model["perplexity"],
-            response_format={"type": "text"},
+            model=self._model,
+            response_format=RF_TEXT,
             temperature=0.3,
-            extra_body=self._build_osint_params(),
+            extra_body=_OSINT_PARAMS,
         )
-        
+
         summary = (response.text or "").strip() or None
         urls = self._extract_urls_from_response(response.raw)
-        return {"summary": summary, "urls": urls}
+        if key is not None and summary:
+            await self.cache.set(key, {"summary": summary, "urls": urls})
+        return {"summary": summary, "urls": urls, "confidence": self._estimate_confidence(summary, urls)}
+
+    async def search_info_batch(self, people: list[dict]) -> list[dict | BaseException]:
+        """
+        Параллельно ищет информацию о нескольких людях.
+
+        Одновременно в полёте не больше config.max_concurrency запросов. Порядок результатов
+        совпадает с порядком people; исключения возвращаются на месте результата.
+        """
+        async def search(person_data: dict) -> dict:
+            async with self.semaphore:
+                return await self.search_info(person_data)
+
+        return await asyncio.gather(*map(search, people), return_exceptions=True)
+
+    @staticmethod
+    def _estimate_confidence(summary: str | None, urls: list[str]) -> str:
+        """
+        Оценивает уровень доверия к результату поиска.
+
+        Главный признак — число новых фактов в JSON-ответе (perp_search возвращает
+        {"new_facts": [...]}): нет фактов или ответ не разобрать — 'low'.
+        Число источников учитывается вторым: меньше двух ссылок — не выше 'medium'.
+
+        Returns:
+            str: 'low', 'medium' или 'high'.
+        """
+        if not PerplexityClient._parse_new_facts(summary):
+            return "low"
+        if len(urls) < 2:
+            return "medium"
+        return "high"
 
     @staticmethod
-    def _build_osint_params() -> dict:
-        """Создаёт словарь OSINT-настроек запроса для perp."""
-        return {
-            "top_p": 0.9,
-            "presence_penalty": 0.3,
-            "frequency_penalty": 0.2,
-            "web_search_options": {
-                "search_context_size": "high",  # medium low
-                "include_domains": None,
-            },
-            "search_language_filter": ["en", "ru"],
-            "return_related_questions": False,
-            "search_mode": "web",
-            "max_tokens_per_page": 150,
-            "num_search_results": None,
-            "return_images": True,
-            "image_format_filter": ["gif", "jpg", "png", "webp"],
-        }
-
-    def _build_search_pieces(self, person_data: dict) -> list[str]:
-        """Формирует список строк для шаблона perp_search."""
-        first_name = person_data.get("meaningful_first_name", "")
-        last_name = person_data.get("meaningful_last_name", "")
-        about = person_data.get("meaningful_about", "")
-        extracted_links = person_data.get("extracted_links", [])
-        birth_date = person_data.get("birth_date", '')
+    def _parse_new_facts(summary: str | None) -> list:
+        """Достаёт список new_facts из ответа perp_search; при ошибке разбора — пустой список."""
+        if not summary:
+            return []
+        # Модель иногда оборачивает JSON в ```json ... ``` — берём содержимое фигурных скобок
+        start, end = summary.find("{"), summary.rfind("}")
+        if start == -1 or end < start:
+            return []
+        try:
+            parsed = jsonlib.loads(summary[start:end + 1])
+        except jsonlib.JSONDecodeError:
+            return []
+        facts = parsed.get("new_facts") if isinstance(parsed, dict) else None
+        return [fact for fact in facts if fact] if isinstance(facts, list) else []
+
+    @staticmethod
+    def _canonical_person_key(person_data: dict) -> str:
+        """Нормализованное представление полей, влияющих на поиск, — для ключа кэша."""
+        get = person_data.get
+
+        def norm(value: Any) -> str:
+            return " ".join(str(value).split()).lower() if value else ""
+
+        return jsonlib.dumps([
+            norm(get("meaningful_first_name")),
+            norm(get("meaningful_last_name")),
+            norm(get("meaningful_about")),
+            norm(get("birth_date")),
+            sorted({norm(link) for link in get("extracted_links") or ()}),
+        ])
 
+    def _build_search_pieces(self, person_data: dict) -> str:
+        """Формирует блок известной информации для шаблона perp_search."""
+        get = person_data.get
         pieces = [
-            f"- Имя: {first_name}",
-            f"- Фамилия: {last_name}",
+            f"- Имя: {get('meaningful_first_name', '')}",
+            f"- Фамилия: {get('meaningful_last_name', '')}",
         ]
-        if about:
+        if about := get("meaningful_about", ""):
             pieces.append(f"- Доп. информация: {about}")
-        if birth_date:
+        if birth_date := get("birth_date", ""):
             pieces.append(f"- Дата рождения: {birth_date}")
-        if extracted_links:
+        if extracted_links := get("extracted_links", []):
             pieces.append("- Найденные ссылки: " + ", ".join(extracted_links))
-        return pieces
+        return "\n".join(pieces)
 
-    def _extract_urls_from_response(self, raw_completion: Any | None) -> list[str]:
-        """Извлекает URL-ы из сырого ответа completion."""
-        urls = []
+    @staticmethod
+    def _extract_urls_from_response(raw_completion: Any | None) -> list[str]:
+        """
+        Извлекает уникальные URL-ы из сырого ответа completion.
+
+        Каждая аннотация проверяется отдельно: аннотация без url_citation или url
+        пропускается и не отбрасывает остальные ссылки.
+        """
         if not raw_completion:
-            return urls
-        try:
-            for choice in getattr(raw_completion, "choices", []):
-                message = getattr(choice, "message", None)
-                for ann in getattr(message, "annotations", []):
-                    citation = getattr(ann, "url_citation", None)
-                    url = getattr(citation, "url", None)
-                    if url:
-                        urls.append(url)
-        except Exception as exc:
-            self.logger.error("Ошибка извлечения URL", exc_info=exc)
-            pass
-        return urls
+            return []
+        # dict.fromkeys убирает повторы, сохраняя порядок первого упоминания
+        return list(dict.fromkeys(
+            url
+            for choice in raw_completion.choices
+            for ann in (choice.message and choice.message.annotations) or ()
+            if (url := _citation_url(ann))
+        ))
+
+
+_perp_client: PerplexityClient | None = None
+
+
+def get_perp_client() -> PerplexityClient:
+    """Возвращает общий для процесса экземпляр PerplexityClient."""
+    global _perp_client
+    if _perp_client is None:
+        _perp_client = PerplexityClient()
+    return _perp_client
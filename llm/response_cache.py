@@ -0,0 +1,111 @@
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from typing import Any
+
+import config
+from utils.db import get_db
+
+logger = logging.getLogger(__name__)
+
+
+def response_cache_key(model: str, template: str, prompt: str) -> str:
+    """
+    Ключ кэша ответа LLM.
+
+    Args:
+        model: Модель, которой отправляется запрос.
+        template: Имя шаблона промпта.
+        prompt: Отрисованный промпт.
+
+    Returns:
+        str: sha256 в hex.
+    """
+    return hashlib.sha256(f"{model}\x00{template}\x00{prompt}".encode()).hexdigest()
+
+
+class LlmResponseCache:
+    """
+    Кэш JSON-ответов LLM в таблице PostgreSQL с LRU/TTL-слоем в памяти процесса.
+
+    Таблица переживает перезапуски и пересоздание таблиц пайплайна (dbcreate её не трогает);
+    слой в памяти избавляет повторные запросы внутри процесса от похода в БД.
+    Сбой кэша не прерывает обработку: запрос просто уходит в LLM.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = config.LLM_MEMORY_CACHE_SIZE,
+        ttl: float = config.LLM_MEMORY_CACHE_TTL,
+        max_age: float | None = None
+    ) -> None:
+        """
+        Args:
+            maxsize: Число записей в памяти процесса.
+            ttl: Время жизни записи в памяти, сек.
+            max_age: Срок годности записи в БД, сек. (None — бессрочно). Устаревшая запись
+                считается промахом и перезаписывается новым ответом.
+        """
+        self._table_ready = False
+        self._table_lock = asyncio.Lock()
+        self.maxsize = maxsize
+        self.ttl = ttl if max_age is None else min(ttl, max_age)
+        self.max_age = max_age
+        self._memory: OrderedDict[str, tuple[float, dict[str, Any]]] = OrderedDict()
+
+    def _memory_get(self, key: str) -> dict[str, Any] | None:
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        expires_at, response = entry
+        if expires_at < time.monotonic():
+            del self._memory[key]
+            return None
+        self._memory.move_to_end(key)
+        return response
+
+    def _memory_set(self, key: str, response: dict[str, Any]) -> None:
+        if self.maxsize <= 0:
+            return
+        self._memory[key] = (time.monotonic() + self.ttl, response)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.maxsize:
+            self._memory.popitem(last=False)
+
+    async def _ensure_table(self) -> None:
+        if self._table_ready:
+            return
+        async with self._table_lock:
+            if not self._table_ready:
+                db = await get_db()
+                await db.execute(config.CREATE_LLM_CACHE_TABLE_QUERY)
+                self._table_ready = True
+
+    async def get(self, key: str) -> dict[str, Any] | None:
+        """Возвращает сохранённый ответ или None."""
+        response = self._memory_get(key)
+        if response is not None:
+            return response
+        try:
+            await self._ensure_table()
+            db = await get_db()
+            row = await db.fetchrow(config.SELECT_LLM_CACHE_QUERY, key, self.max_age)
+        except Exception as e:
+            logger.warning(f"Ошибка чтения кэша LLM: {e}")
+            return None
+        if row is None:
+            return None
+        self._memory_set(key, row["response"])
+        return row["response"]
+
+    async def set(self, key: str, response: dict[str, Any]) -> None:
+        """Сохраняет ответ (существующая запись, например устаревшая, перезаписывается)."""
+        self._memory_set(key, response)
+        try:
+            await self._ensure_table()
+            db = await get_db()
+            await db.execute(config.INSERT_LLM_CACHE_QUERY, key, response)
+        except Exception as e:
+            logger.warning(f"Ошибка записи в кэш LLM: {e}")
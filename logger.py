@@ -1,19 +1,50 @@
+import atexit
 import logging
+import logging.handlers
 import os
+import queue
 import sys
+from contextvars import ContextVar
 from datetime import datetime
 
+# Контекст текущей задачи (например, этап пайплайна). Устанавливается один раз на задачу
+# и попадает во все записи, сделанные в ней, включая логи LLM-клиентов.
+log_context: ContextVar[str] = ContextVar("log_context", default="")
+
+_listener: logging.handlers.QueueListener | None = None
+
+
+def _stop_listener() -> None:
+    """Дописывает записи из очереди и останавливает фоновый поток логирования."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+class ContextFilter(logging.Filter):
+    """Добавляет в запись поле context из log_context."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = log_context.get()
+        record.context = f"[{context}] " if context else ""
+        return True
+
 
 def setup_logging(log_dir: str = "logs"):
     """Настройка логирования.
     INFO и выше → в консоль,
     DEBUG/INFO/WARNING/ERROR → в файл logs/YYYY-MM-DD.log.
+    Общий уровень задаётся переменной окружения LOG_LEVEL (по умолчанию DEBUG).
+    Записи пишутся в консоль и файл из фонового потока QueueListener: код
+    (и event loop) только кладёт запись в очередь, без системных вызовов write.
     """
+    global _listener
     os.makedirs(log_dir, exist_ok=True)
     log_file = os.path.join(log_dir, f"{datetime.now().date()}.log")
 
     formatter = logging.Formatter(
-        '[PRM-ENRICH] [%(asctime)s] [%(filename)s:%(lineno)d:%(funcName)s] - %(levelname)s - %(message)s'
+        '[PRM-ENRICH] [%(asctime)s] [%(filename)s:%(lineno)d:%(funcName)s] - %(levelname)s - %(context)s%(message)s'
     )
 
     console_handler = logging.StreamHandler(sys.stdout)
@@ -24,12 +55,21 @@ def setup_logging(log_dir: str = "logs"):
     file_handler.setLevel(logging.NOTSET)
     file_handler.setFormatter(formatter)
 
+    if _listener is None:
+        atexit.register(_stop_listener)
+    _stop_listener()
+    records: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(records, console_handler, file_handler, respect_handler_level=True)
+    _listener.start()
+
     logger = logging.getLogger()
     logger.handlers.clear()
-    logger.setLevel(logging.DEBUG)
+    logger.setLevel(os.getenv("LOG_LEVEL", "DEBUG").upper())
 
-    logger.addHandler(console_handler)
-    logger.addHandler(file_handler)
+    # Фильтр на QueueHandler: contextvars читаются в потоке и задаче, где сделана запись
+    queue_handler = logging.handlers.QueueHandler(records)
+    queue_handler.addFilter(ContextFilter())
+    logger.addHandler(queue_handler)
 
     logger.info(f"✅ Логирование инициализировано. Логи пишутся в: {log_file}")
     return logger
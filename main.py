@@ -1,38 +1,104 @@
 import argparse
 import asyncio
 import base64
-import json
 import logging
 import mimetypes
+from collections.abc import AsyncIterator
+from functools import cache, lru_cache
 from pathlib import Path
 from typing import Any
 
 import config
-from jinja2 import Environment, FileSystemLoader
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, Template
+from llm.base_llm_client import close_http_client
 from logger import setup_logging
 from services.fill_task_queue import TaskQueue
-from utils import cleaner
-from utils.db import AsyncDatabaseManager
-from utils.task_worker import worker_loop
+from utils import cleaner, jsonlib
+from utils.db import close_db, get_db
+from utils.task_worker import start_task_listener, worker_loop
+
+try:
+    import uvloop
+except ImportError:  # uvloop нет под Windows — работаем на стандартном цикле
+    uvloop = None
+
+try:
+    import pybase64  # SIMD-кодирование base64 для фото в HTML-отчёте
+except ImportError:
+    pybase64 = None
 
 logger = logging.getLogger(__name__)
 
 
-async def _get_db() -> AsyncDatabaseManager:
-    """Создаёт подключение к базе данных и возвращает менеджер."""
-    db = AsyncDatabaseManager()
-    await db.connect()
-    logger.debug("Соединение с базой данных установлено.")
-    return db
+@cache
+def _env() -> Environment:
+    """
+    Общий для процесса Jinja2 Environment отчётов: шаблоны не меняются во время работы.
+
+    Скомпилированный байткод шаблонов хранится во временном каталоге пользователя,
+    поэтому повторные запуски CLI не разбирают template.html заново. Ключ кэша Jinja
+    не учитывает enable_async, отсюда отдельный шаблон имени файлов.
+    """
+    return Environment(
+        loader=FileSystemLoader('templates/'),
+        autoescape=True,
+        auto_reload=False,
+        cache_size=400,
+        enable_async=True,
+        bytecode_cache=FileSystemBytecodeCache(pattern='__prm_report_async_%s.cache'),
+    )
+
+
+@cache
+def _template() -> Template:
+    """Скомпилированный шаблон HTML-отчёта."""
+    return _env().get_template('template.html')
 
 
-def _prepare_environment() -> tuple[Environment, str]:
-    """Подготавливает Jinja2 Environment и загружает CSS-шаблон."""
-    env = Environment(loader=FileSystemLoader('templates/'), autoescape=True)
+@cache
+def _css() -> str:
+    """Содержимое CSS для HTML-отчёта."""
     css_path = Path('templates/style.css')
     css_content = css_path.read_text(encoding='utf-8')
-    logger.debug(f"CSS успешно загружен из {css_path}")
-    return env, css_content
+    logger.debug("CSS успешно загружен из %s", css_path)
+    return css_content
+
+
+def _b64encode(data: bytes) -> str:
+    """Кодирует байты в base64-строку (pybase64, если установлен)."""
+    if pybase64 is not None:
+        return pybase64.b64encode_as_string(data)
+    return base64.b64encode(data).decode('ascii')
+
+
+@lru_cache(maxsize=32)
+def _mime_for(suffix: str) -> str:
+    """MIME-тип фото по расширению файла (по умолчанию image/jpeg)."""
+    mime, _ = mimetypes.guess_type(f"photo{suffix}")
+    return mime or 'image/jpeg'
+
+
+# Кэшируются только небольшие файлы (аватары, общие фото команды) и немного: кэш живёт весь экспорт,
+# и без этих ограничений съел бы выигрыш потоковой выгрузки — худший случай около 16 × 700 КБ.
+_PHOTO_CACHE_SIZE = 16
+_PHOTO_CACHE_MAX_BYTES = 512 * 1024
+
+
+def _encode_local_photo(src: str) -> str:
+    """Кодирует локальное фото в data URI."""
+    file_path = Path(src)
+    return f"data:{_mime_for(file_path.suffix.lower())};base64,{_b64encode(file_path.read_bytes())}"
+
+
+@lru_cache(maxsize=_PHOTO_CACHE_SIZE)
+def _encode_local_photo_cached(src: str, mtime_ns: int, size: int) -> str:
+    """
+    Кодирует небольшое локальное фото в data URI с кэшированием.
+
+    Одно фото часто встречается у нескольких персон подряд; mtime_ns и size входят в ключ,
+    чтобы изменённый файл перекодировался.
+    """
+    return _encode_local_photo(src)
 
 
 def _process_person_photos(photo_sources: list[str]) -> tuple[list[str], list[str]]:
@@ -43,50 +109,43 @@ def _process_person_photos(photo_sources: list[str]) -> tuple[list[str], list[st
             continue
         if src.startswith('prm_media/'):
             try:
-                file_path = Path(src)
-                mime, _ = mimetypes.guess_type(file_path)
-                mime = mime or 'image/jpeg'
-                encoded = base64.b64encode(file_path.read_bytes()).decode('ascii')
-                local_photos.append(f"data:{mime};base64,{encoded}")
-                logger.debug(f"Локальное фото добавлено: {src}")
+                stat = Path(src).stat()
+                if stat.st_size <= _PHOTO_CACHE_MAX_BYTES:
+                    local_photos.append(_encode_local_photo_cached(src, stat.st_mtime_ns, stat.st_size))
+                else:
+                    local_photos.append(_encode_local_photo(src))
+                logger.debug("Локальное фото добавлено: %s", src)
             except FileNotFoundError:
                 logger.warning(f"Пропущено — файл не найден: {src}")
             except Exception as e:
                 logger.error(f"Ошибка при обработке файла {src}: {e}")
         else:
             web_photos.append(src)
-            logger.debug(f"Веб-фото добавлено: {src}")
+            logger.debug("Веб-фото добавлено: %s", src)
     return local_photos, web_photos
 
 
 async def clean_and_create_db() -> None:
     """Очищает и пересоздаёт основные таблицы проекта."""
     logger.info("🔄 Подготовка баз данных...")
-    db = await _get_db()
-    try:
-        for query in (
-            config.DROP_AND_CREATE_CLEANED_TABLE_QUERY,
-            config.DROP_AND_CREATE_RESULT_TABLE_QUERY,
-            config.DROP_AND_CREATE_TASK_QUEUE_QUERY,
-        ):
-            logger.debug(f"Выполнение SQL:\n{query}")
-            await db.execute(query)
-        logger.info("✅ Таблицы успешно пересозданы")
-    finally:
-        await db.close()
-        logger.debug("Соединение с БД закрыто.")
+    db = await get_db()
+    for query in (
+        config.DROP_AND_CREATE_CLEANED_TABLE_QUERY,
+        config.DROP_AND_CREATE_RESULT_TABLE_QUERY,
+        config.DROP_AND_CREATE_TASK_QUEUE_QUERY,
+    ):
+        logger.debug("Выполнение SQL:\n%s", query)
+        await db.execute(query)
+    logger.info("✅ Таблицы успешно пересозданы")
 
 
 async def get_pipeline_stats() -> dict[str, Any]:
     """Возвращает статистику по статусам обработки."""
     logger.info("Сбор статистики по флагам этапов...")
-    db = await _get_db()
-    try:
-        logger.debug(f"SQL-запрос статистики:\n{config.STATS_QUERY}")
-        rows = await db.fetch(config.STATS_QUERY)
-        stats = rows[0] if rows else {}
-    finally:
-        await db.close()
+    db = await get_db()
+    logger.debug("SQL-запрос статистики:\n%s", config.STATS_QUERY)
+    rows = await db.fetch(config.STATS_QUERY)
+    stats = rows[0] if rows else {}
 
     if stats:
         logger.info("----- 📈 Pipeline Stats -----")
@@ -98,87 +157,141 @@ async def get_pipeline_stats() -> dict[str, Any]:
     return stats
 
 
-async def export_to_json():
-    db = AsyncDatabaseManager()
-    await db.connect()
-    try:
-        query = """SELECT * FROM public.person_result_data WHERE done = TRUE;"""
-        persons = await db.fetch(query)
-
-        for person in persons:
-            person['fetch_date'] = str(person.get('fetch_date', ''))
-            original_summary = person.get('summary', '')
-            person['summary'] = cleaner.clean_summary(original_summary)
-            person_facts = []
-            person_summary = ''
-
-            if original_summary:
-                for fact in original_summary[original_summary.find("[") + 1:original_summary.find("]")].strip().split("\","):
-                    person_facts.append(fact.replace("\"", "").strip())
-                person_summary = original_summary[original_summary.find("summary") + 10:-2].strip()
+def _parse_summary(original_summary: str) -> tuple[str, list[str]]:
+    """
+    Разбирает JSON-ответ Perplexity из колонки summary.
 
-            person['summary'] = person_summary
-            person['new_facts'] = person_facts
+    Args:
+        original_summary: Сырой текст summary.
 
-        with open('people_analysis.json', 'w', encoding='utf-8') as f:
-            json.dump(persons, f, ensure_ascii=False, indent=2)
-
-        logger.info(f"✅ Экспортировано {len(persons)} записей в people_analysis.json")
+    Returns:
+        tuple[str, list[str]]: Текст summary и список новых фактов.
+    """
+    if not original_summary:
+        return '', []
+    try:
+        parsed = jsonlib.loads(original_summary)
+    except jsonlib.JSONDecodeError:
+        parsed = None
+    if isinstance(parsed, dict):
+        facts = parsed.get('new_facts') or []
+        if not isinstance(facts, list):
+            facts = [facts]
+        return str(parsed.get('summary') or ''), [str(fact).strip() for fact in facts]
+
+    # Не JSON (например, обёрнут в текст) — старый разбор по позициям скобок
+    logger.debug("summary не является JSON, используется разбор по скобкам")
+    person_facts = [
+        fact.replace("\"", "").strip()
+        for fact in original_summary[original_summary.find("[") + 1:original_summary.find("]")].strip().split("\",")
+    ]
+    person_summary = original_summary[original_summary.find("summary") + 10:-2].strip()
+    return person_summary, person_facts
+
+
+async def export_to_json(pretty: bool = False):
+    db = await get_db()
+    try:
+        count = 0
+
+        # Строки идут через серверный курсор и сразу пишутся в файл: в памяти не больше EXPORT_PREFETCH записей
+        with open('people_analysis.json', 'wb') as f:
+            f.write(b'[')
+            async for person in db.iterate(config.SELECT_EXPORT_JSON_QUERY, prefetch=config.EXPORT_PREFETCH):
+                person['fetch_date'] = str(person.get('fetch_date', ''))
+                person['summary'], person['new_facts'] = _parse_summary(person.get('summary') or '')
+
+                # Компактный вывод по умолчанию — для машинных потребителей; --pretty — с отступами
+                if pretty:
+                    f.write(b',\n  ' if count else b'\n  ')
+                    f.write(jsonlib.dumps_bytes(person, indent=True).replace(b'\n', b'\n  '))
+                else:
+                    f.write(b',' if count else b'')
+                    f.write(jsonlib.dumps_bytes(person))
+                count += 1
+            f.write(b'\n]' if pretty and count else b']')
+
+        logger.info(f"✅ Экспортировано {count} записей в people_analysis.json")
 
     except Exception as e:
         logger.error(f"❌ Ошибка при экспорте: {e}")
-    finally:
-        await db.close()
+
+
+async def _iter_export_persons(db) -> AsyncIterator[dict[str, Any]]:
+    """
+    Отдаёт персоны для HTML-отчёта пачками из серверного курсора.
+
+    Фото каждой пачки читаются и кодируются в пуле потоков параллельно,
+    чтобы не блокировать цикл событий.
+    """
+    batch: list[dict[str, Any]] = []
+    rows = db.iterate(config.SELECT_DONE_QUERY, prefetch=config.EXPORT_PREFETCH)
+    while True:
+        person = await anext(rows, None)
+        if person is not None:
+            batch.append(person)
+            if len(batch) < config.EXPORT_PREFETCH:
+                continue
+        if not batch:
+            return
+        photos = await asyncio.gather(
+            *(asyncio.to_thread(_process_person_photos, p.get('photos', [])) for p in batch)
+        )
+        for p, (local_photos, web_photos) in zip(batch, photos, strict=True):
+            p['summary'] = cleaner.clean_summary(p.get('summary', ''))
+            p['local_photos'] = local_photos
+            p['web_photos'] = web_photos
+            yield p
+        batch = []
 
 
 async def export_to_html() -> None:
     """Экспортирует результаты из БД в HTML-файл."""
     logger.info("Экспорт результатов в HTML...")
-    db = await _get_db()
-    try:
-        logger.debug(f"SQL для экспорта:\n{config.SELECT_DONE_QUERY}")
-        persons = await db.fetch(config.SELECT_DONE_QUERY)
-    finally:
-        await db.close()
+    db = await get_db()
+    logger.debug("SQL для экспорта:\n%s", config.SELECT_DONE_QUERY)
+    persons = _iter_export_persons(db)
+    first = await anext(persons, None)
 
-    if not persons:
+    if first is None:
         logger.warning("⚠️ Нет данных для экспорта")
         return
 
-    env, css_content = _prepare_environment()
-    template = env.get_template('template.html')
+    count = 0
 
-    for person in persons:
-        person['summary'] = cleaner.clean_summary(person.get('summary', ''))
-        local_photos, web_photos = _process_person_photos(person.get('photos', []))
-        person['local_photos'] = local_photos
-        person['web_photos'] = web_photos
+    async def people() -> AsyncIterator[dict[str, Any]]:
+        nonlocal count
+        person = first
+        while person is not None:
+            count += 1
+            yield person
+            person = await anext(persons, None)
 
-    result_html = template.render(people=persons, css_content=css_content)
+    # Шаблон рендерится потоково: HTML пишется в файл по мере чтения строк из БД
     output_path = Path("people_analysis.html")
-    output_path.write_text(result_html, encoding='utf-8')
+    with output_path.open('w', encoding='utf-8', buffering=1 << 20) as f:
+        async for chunk in _template().generate_async(people=people(), css_content=_css()):
+            f.write(chunk)
 
     logger.info(f"✅ HTML-таблица сохранена: {output_path}")
-    logger.debug(f"Количество экспортированных персон: {len(persons)}")
+    logger.debug("Количество экспортированных персон: %s", count)
 
 
 async def run_workers(count: int) -> None:
     """Запускает указанное количество асинхронных воркеров."""
-    db = await _get_db()
-    queue = TaskQueue()
+    db = await get_db()
+    queue = TaskQueue(db)
     await queue.fill_all()
     await asyncio.sleep(2)
 
     worker_count = count or config.ASYNC_WORKERS
     logger.info(f"🚀 Запуск {worker_count} воркеров...")
-    logger.debug(f"Активные обработчики: {worker_count}")
+    logger.debug("Активные обработчики: %s", worker_count)
 
+    await start_task_listener(db)
     workers = [worker_loop(i, db) for i in range(worker_count)]
-    try:
-        await asyncio.gather(*workers)
-    finally:
-        await db.close()
-        logger.info("Все воркеры завершили работу")
+    await asyncio.gather(*workers)
+    logger.info("Все воркеры завершили работу")
 
 
 async def _run_single_command(args) -> None:
@@ -186,19 +299,19 @@ async def _run_single_command(args) -> None:
     if args.dbcreate:
         await clean_and_create_db()
     elif args.tasks:
-        queue = TaskQueue()
+        queue = TaskQueue(await get_db())
         await queue.fill_all()
     elif args.stats:
         await get_pipeline_stats()
     elif args.html:
         await export_to_html()
     elif args.json:
-        await export_to_json()
+        await export_to_json(args.pretty)
     elif args.qt:
         await clean_and_create_db()
         await run_workers(1)
         await export_to_html()
-        await export_to_json()
+        await export_to_json(args.pretty)
     elif args.run > 0:
         await run_workers(args.run)
     else:
@@ -214,15 +327,20 @@ async def main():
     parser.add_argument("--stats", action="store_true", help="Показать статистику по флагам")
     parser.add_argument("--html", action="store_true", help="Экспортировать результаты в HTML")
     parser.add_argument("--json", action="store_true", help="Экспортировать результаты в JSON")
+    parser.add_argument("--pretty", action="store_true", help="JSON-экспорт с отступами (по умолчанию компактный)")
     parser.add_argument("--qt", action="store_true", help="Быстрый тест (для отладки)")
 
     args = parser.parse_args()
-    await _run_single_command(args)
+    try:
+        await _run_single_command(args)
+    finally:
+        await close_http_client()
+        await close_db()
 
 
 if __name__ == "__main__":
     setup_logging()
     try:
-        asyncio.run(main())
+        asyncio.run(main(), loop_factory=uvloop.new_event_loop if uvloop else None)
     except KeyboardInterrupt:
         logger.info("Завершение работы...")
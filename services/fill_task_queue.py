@@ -11,17 +11,25 @@ class TaskQueue:
     Класс для управления очередью задач.
     """
 
-    def __init__(self) -> None:
-        """Создаёт подключение к базе данных."""
-        self.db = AsyncDatabaseManager()
+    def __init__(self, db: AsyncDatabaseManager | None = None) -> None:
+        """
+        Создаёт подключение к базе данных.
+
+        Args:
+            db: Общий менеджер БД. Если передан, очередь не открывает и не закрывает свой пул.
+        """
+        self._owns_db = db is None
+        self.db = db or AsyncDatabaseManager()
 
     async def connect(self) -> None:
         """Открывает соединение с базой."""
-        await self.db.connect()
+        if self._owns_db:
+            await self.db.connect()
 
     async def close(self) -> None:
         """Закрывает соединение с базой."""
-        await self.db.close()
+        if self._owns_db:
+            await self.db.close()
 
     async def _insert_task(self, person_id: int, task_type: str) -> None:
         """
@@ -33,20 +41,22 @@ class TaskQueue:
         """
         condition = config.TASK_RULES[task_type]
 
+        # Значения передаются параметрами: текст запроса один на task_type,
+        # и asyncpg переиспользует подготовленное выражение из кэша соединения
         query = f"""
             INSERT INTO task_queue (person_id, task_type, status)
-            SELECT {person_id}, '{task_type}', 'pending'
+            SELECT p.person_id, $2, 'pending'
             FROM {config.result_table_name} AS p
-            WHERE p.person_id = {person_id}
+            WHERE p.person_id = $1
                 AND {condition}
                 AND
                     NOT EXISTS (
                         SELECT 1 FROM task_queue
-                        WHERE person_id = {person_id} AND task_type = '{task_type}'
+                        WHERE person_id = $1 AND task_type = $2
                     )
         """
 
-        await self.db.execute(query)
+        await self.db.execute(query, person_id, task_type)
 
     async def _insert_tasks_bulk(self, task_type: str) -> None:
         """
@@ -58,7 +68,7 @@ class TaskQueue:
         condition = config.TASK_RULES[task_type]
         done_flag = config.TASK_FLAGS[task_type]
 
-        logger.debug(f"Bulk insert задач типа '{task_type}' с условием: {condition}")
+        logger.debug("Bulk insert задач типа '%s' с условием: %s", task_type, condition)
 
         count_query = f"""
             SELECT COUNT(*) as count
@@ -91,7 +101,7 @@ class TaskQueue:
             """
             await self.db.execute(insert_query)
 
-        logger.debug(f"Добавление задач типа '{task_type}' завершено. Добавлено задач: {expected_count}")
+        logger.debug("Добавление задач типа '%s' завершено. Добавлено задач: %s", task_type, expected_count)
 
     async def fill_all(self) -> None:
         """
@@ -104,7 +114,7 @@ class TaskQueue:
             logger.info("Обновляем всю очередь задач...")
 
             for task_type in config.TASK_TYPES:
-                logger.debug(f"Обрабатываем задания типа '{task_type}'...")
+                logger.debug("Обрабатываем задания типа '%s'...", task_type)
                 await self._insert_tasks_bulk(task_type)
 
             logger.info("Вся очередь задач успешно обновлена.")
@@ -125,6 +135,6 @@ class TaskQueue:
         await self.connect()
         try:
             await self._insert_task(person_id, task_type)
-            logger.debug(f"[person_id={person_id}] Добавлена задача '{task_type}'.")
+            logger.debug("[person_id=%s] Добавлена задача '%s'.", person_id, task_type)
         finally:
             await self.close()
@@ -0,0 +1,62 @@
+import random
+import re
+
+from config import EMOJI_CODEPOINT_RANGES, ENRU_CHARS_PATTERN
+from utils import cleaner
+
+# Исходная regex-реализация _clean_common: переписанная через str.translate должна совпадать с ней
+_EMOJI_PATTERN = re.compile("[" + "".join(f"\\U{start:08X}-\\U{end:08X}" for start, end in EMOJI_CODEPOINT_RANGES) + "]+")
+
+
+def _reference_clean(value: str, remove_non_enru: bool, keep_symbols: bool) -> str | None:
+    if not value:
+        return None
+    value = _EMOJI_PATTERN.sub('', value)
+    if remove_non_enru:
+        value = ENRU_CHARS_PATTERN.sub('', value)
+    if not keep_symbols:
+        value = re.sub(r'[|/\\\[\]{}(),*+=<>^~"]+', ' ', value)
+    value = re.sub(r'[\u200b\u200c\u200d\ufeff]', '', value)
+    value = re.sub(r'\s{2,}', ' ', value).strip()
+    return value if len(value) >= 2 else None
+
+
+_ALPHABET = 'aZяЁ -_.@1|/\\[]{}(),*+=<>^~"\u200b\u200c\u200d\ufeff\t\n😀🚀🇷✂🤖'
+_SAMPLES = [
+    "Иван 😀 Петров",
+    "John | Doe // CEO",
+    "Anna\u200b\u200dMaria",
+    "  [Team]  {Lead}  ",
+    "a||b",
+    "a|\u200b|b",
+    "😀",
+    "",
+]
+
+
+def _cases() -> list[str]:
+    rng = random.Random(42)
+    return _SAMPLES + ["".join(rng.choices(_ALPHABET, k=rng.randint(0, 20))) for _ in range(2000)]
+
+
+def test_clean_name_field_matches_regex_version():
+    for value in _cases():
+        assert cleaner.clean_name_field(value) == _reference_clean(value, remove_non_enru=True, keep_symbols=False), repr(value)
+
+
+def test_clean_second_name_field_matches_regex_version():
+    for value in _cases():
+        assert cleaner.clean_second_name_field(value) == _reference_clean(value, remove_non_enru=False, keep_symbols=True), repr(value)
+
+
+def test_clean_common_without_enru_filter_matches_regex_version():
+    for value in _cases():
+        assert cleaner._clean_common(value) == _reference_clean(value, remove_non_enru=False, keep_symbols=False), repr(value)
+
+
+def test_extract_links_dedups_across_fields():
+    assert cleaner.extract_links("см. https://a.ru и @user", None, "https://a.ru\nt.me/chan") == ["https://a.ru", "@user", "t.me/chan"]
+
+
+def test_clean_summary_removes_refs():
+    assert cleaner.clean_summary("Текст [1] с ссылками [2]") == "Текст с ссылками"
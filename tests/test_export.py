@@ -0,0 +1,24 @@
+from main import _parse_summary
+
+
+def test_parse_summary_reads_json():
+    summary = '{"new_facts": ["Основатель X [1]", " CTO Y "], "summary": "Предприниматель"}'
+    assert _parse_summary(summary) == ("Предприниматель", ["Основатель X [1]", "CTO Y"])
+
+
+def test_parse_summary_without_summary_key():
+    assert _parse_summary('{"new_facts": ["Факт"]}') == ("", ["Факт"])
+
+
+def test_parse_summary_wraps_scalar_facts():
+    assert _parse_summary('{"new_facts": "Факт"}') == ("", ["Факт"])
+
+
+def test_parse_summary_empty():
+    assert _parse_summary("") == ("", [])
+
+
+def test_parse_summary_falls_back_to_bracket_slicing():
+    summary = 'Ответ: {"new_facts": ["a", "b"], "summary": "text"} конец'
+    _, facts = _parse_summary(summary)
+    assert facts == ["a", "b"]
@@ -0,0 +1,40 @@
+import asyncio
+
+from llm.llm_client import LlmClient
+
+
+class FakeStreamClient(LlmClient):
+    """LlmClient без сети и кэша: stream отдаёт заданные фрагменты и запоминает, сколько прочитано."""
+
+    def __init__(self, chunks: list[str]) -> None:
+        self.cache = None
+        self.chunks = chunks
+        self.read = 0
+        self.closed = False
+
+    async def stream(self, prompt, model=None, *, response_format=None, temperature=None):
+        try:
+            for chunk in self.chunks:
+                self.read += 1
+                yield chunk
+        finally:
+            self.closed = True
+
+
+def _verdict(client: FakeStreamClient) -> bool:
+    return asyncio.run(client.ask_verdict("prompt", model="m", template="postcheck"))
+
+
+def test_verdict_stops_stream_once_matched():
+    client = FakeStreamClient(['{"is_valid": ', "true", ', "reason": "', "долгое пояснение", '"}'])
+    assert _verdict(client) is True
+    assert client.read == 2
+    assert client.closed
+
+
+def test_verdict_matches_capitalized_value():
+    assert _verdict(FakeStreamClient(['{"is_valid": False}'])) is False
+
+
+def test_verdict_without_is_valid_is_false():
+    assert _verdict(FakeStreamClient(['{"reason": "нет вердикта"}'])) is False
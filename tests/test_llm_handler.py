@@ -0,0 +1,75 @@
+import asyncio
+
+from handlers.llm import parse_persons
+from llm.base_llm_client import LlmRequestError
+from llm.llm_client import MeaningfulFields
+
+
+def _fields(person_id: int) -> MeaningfulFields:
+    return MeaningfulFields(meaningful_first_name=f"n{person_id}", meaningful_last_name="x", meaningful_about=None)
+
+
+class FakeLlm:
+    """Пачечный парсинг отвечает только за людей из answered; одиночный — за всех."""
+
+    def __init__(self, answered: set[int], fail_requests: bool = False) -> None:
+        self.answered = answered
+        self.fail_requests = fail_requests
+        self.batch_sizes: list[int] = []
+        self.single_ids: list[int] = []
+
+    async def async_parse_batch_to_meaningful(self, people: list[dict]) -> dict[int, MeaningfulFields]:
+        self.batch_sizes.append(len(people))
+        if self.fail_requests:
+            raise LlmRequestError("down")
+        return {p["person_id"]: _fields(p["person_id"]) for p in people if p["person_id"] in self.answered}
+
+    async def async_parse_single_to_meaningful(self, person_data: dict) -> MeaningfulFields:
+        self.single_ids.append(person_data["person_id"])
+        if self.fail_requests:
+            raise LlmRequestError("down")
+        return _fields(person_data["person_id"])
+
+
+def _run(llm: FakeLlm, count: int, batch_size: int) -> dict:
+    inputs = {i: {"person_id": i} for i in range(count)}
+    return asyncio.run(parse_persons(llm, inputs, batch_size, asyncio.Semaphore(4), worker_id=0))
+
+
+def test_full_batch_needs_one_request():
+    llm = FakeLlm(answered=set(range(8)))
+    results = _run(llm, 8, 8)
+    assert llm.batch_sizes == [8]
+    assert llm.single_ids == []
+    assert results == {i: _fields(i) for i in range(8)}
+
+
+def test_missing_people_are_retried_in_halves_then_one_by_one():
+    llm = FakeLlm(answered=set(range(7)))  # person 7 never comes back in a batch
+    results = _run(llm, 8, 8)
+    assert llm.batch_sizes == [8, 1, 1]  # повторы пачками по 4 и 2 из одного человека
+    assert llm.single_ids == [7]
+    assert results[7] == _fields(7)
+    assert set(results) == set(range(8))
+
+
+def test_missing_people_halving_sizes():
+    llm = FakeLlm(answered=set())
+    _run(llm, 8, 8)
+    assert sorted(llm.batch_sizes, reverse=True) == [8, 4, 4, 2, 2, 2, 2]
+    assert sorted(llm.single_ids) == list(range(8))
+
+
+def test_failed_request_is_not_split_or_retried():
+    llm = FakeLlm(answered=set(range(8)), fail_requests=True)
+    results = _run(llm, 8, 8)
+    assert llm.batch_sizes == [8]
+    assert llm.single_ids == []
+    assert results == dict.fromkeys(range(8))
+
+
+def test_failed_single_request_is_not_retried():
+    llm = FakeLlm(answered=set(), fail_requests=True)
+    results = _run(llm, 1, 1)
+    assert llm.single_ids == [0]
+    assert results == {0: None}
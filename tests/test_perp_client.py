@@ -0,0 +1,54 @@
+from types import SimpleNamespace
+
+from llm.perp_client import PerplexityClient
+
+
+def _annotation(url: str | None) -> SimpleNamespace:
+    return SimpleNamespace(url_citation=SimpleNamespace(url=url))
+
+
+def _completion(*annotations: SimpleNamespace) -> SimpleNamespace:
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(annotations=list(annotations)))])
+
+
+def test_extract_urls_dedups_in_order():
+    raw = _completion(_annotation("https://a"), _annotation("https://b"), _annotation("https://a"))
+    assert PerplexityClient._extract_urls_from_response(raw) == ["https://a", "https://b"]
+
+
+def test_extract_urls_skips_malformed_annotation():
+    raw = _completion(
+        _annotation("https://a"),
+        _annotation("https://b"),
+        _annotation("https://a"),
+        SimpleNamespace(url_citation=None),
+        SimpleNamespace(),
+        _annotation(None),
+        _annotation("https://c"),
+    )
+    assert PerplexityClient._extract_urls_from_response(raw) == ["https://a", "https://b", "https://c"]
+
+
+def test_extract_urls_without_completion():
+    assert PerplexityClient._extract_urls_from_response(None) == []
+    assert PerplexityClient._extract_urls_from_response(SimpleNamespace(choices=[SimpleNamespace(message=None)])) == []
+
+
+def test_confidence_low_without_new_facts():
+    urls = ["https://a", "https://b"]
+    assert PerplexityClient._estimate_confidence('{"new_facts": []}', urls) == "low"
+    assert PerplexityClient._estimate_confidence('{"summary": "text"}', urls) == "low"
+    assert PerplexityClient._estimate_confidence("Данных не найдено", urls) == "low"
+    assert PerplexityClient._estimate_confidence(None, urls) == "low"
+
+
+def test_confidence_uses_url_count_as_secondary_signal():
+    summary = '{"new_facts": ["Основатель компании X"]}'
+    assert PerplexityClient._estimate_confidence(summary, ["https://a", "https://b"]) == "high"
+    assert PerplexityClient._estimate_confidence(summary, ["https://a"]) == "medium"
+    assert PerplexityClient._estimate_confidence(summary, []) == "medium"
+
+
+def test_confidence_parses_fenced_json():
+    summary = '```json\n{"new_facts": ["Факт"]}\n```'
+    assert PerplexityClient._estimate_confidence(summary, ["https://a", "https://b"]) == "high"
@@ -0,0 +1,40 @@
+from llm import response_cache
+from llm.response_cache import LlmResponseCache, response_cache_key
+
+
+def test_key_depends_on_every_part():
+    base = response_cache_key("m", "t", "p")
+    assert base == response_cache_key("m", "t", "p")
+    assert len({base, response_cache_key("m2", "t", "p"), response_cache_key("m", "t2", "p"), response_cache_key("m", "t", "p2")}) == 4
+
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = LlmResponseCache(maxsize=2, ttl=60)
+    cache._memory_set("a", {"v": 1})
+    cache._memory_set("b", {"v": 2})
+    assert cache._memory_get("a") == {"v": 1}  # "a" становится самым свежим
+    cache._memory_set("c", {"v": 3})
+    assert cache._memory_get("b") is None
+    assert cache._memory_get("a") == {"v": 1}
+    assert cache._memory_get("c") == {"v": 3}
+
+
+def test_memory_tier_expires_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(response_cache.time, "monotonic", lambda: now[0])
+    cache = LlmResponseCache(maxsize=10, ttl=5)
+    cache._memory_set("a", {"v": 1})
+    now[0] += 4
+    assert cache._memory_get("a") == {"v": 1}
+    now[0] += 2
+    assert cache._memory_get("a") is None
+
+
+def test_ttl_is_capped_by_max_age():
+    assert LlmResponseCache(ttl=100, max_age=10).ttl == 10
+
+
+def test_memory_tier_disabled_with_zero_size():
+    cache = LlmResponseCache(maxsize=0)
+    cache._memory_set("a", {"v": 1})
+    assert cache._memory_get("a") is None
@@ -1,10 +1,19 @@
 import logging
 import re
 
-from config import EMOJI_PATTERN, ENRU_CHARS_PATTERN, URL_PATTERN
+from config import EMOJI_TABLE, ENRU_CHARS_PATTERN, URL_PATTERN, ZERO_WIDTH_CHARS
 
 logger = logging.getLogger(__name__)
 
+_SYMBOL_CHARS = '|/\\[]{}(),*+=<>^~"'
+_INVISIBLE_TABLE: dict[int, None] = {**EMOJI_TABLE, **dict.fromkeys(map(ord, ZERO_WIDTH_CHARS))}
+# Эмодзи и zero-width символы удаляются, спецсимволы заменяются пробелом
+_INVISIBLE_OR_SYMBOLS_TABLE: dict[int, str | None] = {**_INVISIBLE_TABLE, **dict.fromkeys(map(ord, _SYMBOL_CHARS), ' ')}
+_MULTISPACE_PATTERN = re.compile(r'\s{2,}')
+_WHITESPACE_PATTERN = re.compile(r'\s+')
+_BAD_LASTNAME_PATTERN = re.compile(r'\.com|@|&|http|www', re.IGNORECASE)
+_SUMMARY_REF_PATTERN = re.compile(r'\s*\[\d+\]\s*')
+
 
 def normalize_empty(value: str | None) -> str | None:
     """
@@ -23,7 +32,7 @@ def normalize_empty(value: str | None) -> str | None:
         # if not val:
             # logger.debug("normalize_empty: строка пуста → None")
         return val or None
-    logger.debug(f"normalize_empty: пропущено значение не типа str ({type(value)})")
+    logger.debug("normalize_empty: пропущено значение не типа str (%s)", type(value))
     return value
 
 
@@ -43,16 +52,16 @@ def _clean_common(value: str, remove_non_enru: bool = False, keep_symbols: bool
         return None
 
     original_value = value
-    value = EMOJI_PATTERN.sub('', value)
 
     if remove_non_enru:
+        # Паттерн не-EN/RU символов покрывает эмодзи, спецсимволы и zero-width
         value = ENRU_CHARS_PATTERN.sub('', value)
+    elif keep_symbols:
+        value = value.translate(_INVISIBLE_TABLE)
+    else:
+        value = value.translate(_INVISIBLE_OR_SYMBOLS_TABLE)
 
-    if not keep_symbols:
-        value = re.sub(r'[|/\\\[\]{}(),*+=<>^~"]+', ' ', value)
-
-    value = re.sub(r'[\u200b\u200c\u200d\uFEFF]', '', value)
-    value = re.sub(r'\s{2,}', ' ', value).strip()
+    value = _MULTISPACE_PATTERN.sub(' ', value).strip()
 
     # logger.debug(f"_clean_common: '{original_value}' → '{value}'")
 
@@ -79,16 +88,11 @@ def extract_links(*fields: str | None) -> list[str]:
     Returns:
         list[str]: Список уникальных ссылок.
     """
-    found_items: list[str] = []
-    for field in fields:
-        if field and isinstance(field, str):
-            matches = URL_PATTERN.findall(field)
-            if matches:
-                # logger.debug(f"extract_links: найдено {len(matches)} ссылок в '{field[:30]}...'")
-                found_items.extend(matches)
-
-    unique_links = list(dict.fromkeys(found_items))
-    logger.debug(f"Извлечено {len(unique_links)} уникальных ссылок")
+    # Один проход regex по всем полям: ни один вариант URL_PATTERN не пересекает пробельный
+    # символ, поэтому разделитель "\n" не даёт совпадению перейти из одного поля в другое
+    text = "\n".join(field for field in fields if field and isinstance(field, str))
+    unique_links = list(dict.fromkeys(URL_PATTERN.findall(text)))
+    logger.debug("Извлечено %s уникальных ссылок", len(unique_links))
     return unique_links
 
 
@@ -99,8 +103,8 @@ def should_move_lastname_to_about(last_name: str | None) -> bool:
     """
     if not last_name:
         return False
-    result = bool(re.search(r'\.com|@|&|http|www', last_name, re.IGNORECASE))
-    logger.debug(f"should_move_lastname_to_about('{last_name}') → {result}")
+    result = _BAD_LASTNAME_PATTERN.search(last_name) is not None
+    logger.debug("should_move_lastname_to_about('%s') → %s", last_name, result)
     return result
 
 
@@ -112,8 +116,8 @@ def clean_summary(text: str) -> str:
         'Текст [1] с ссылками [2]' → 'Текст с ссылками'
     """
     original_text = text
-    cleaned = re.sub(r'\s*\[\d+\]\s*', ' ', text)
-    cleaned = re.sub(r'\s+', ' ', cleaned).strip()
+    cleaned = _SUMMARY_REF_PATTERN.sub(' ', text)
+    cleaned = _WHITESPACE_PATTERN.sub(' ', cleaned).strip()
     # logger.debug(f"clean_summary: '{original_text[:30]}...' → '{cleaned[:30]}...'")
     return cleaned
 
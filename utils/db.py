@@ -1,8 +1,17 @@
+import asyncio
 import logging
+from collections.abc import AsyncIterator, Callable
 from typing import Any
 
 import asyncpg
+import config
 from config import DatabaseConfig
+from utils import jsonlib
+
+
+async def _init_connection(conn: asyncpg.Connection) -> None:
+    """Регистрирует кодек jsonb: списки ссылок читаются и пишутся целиком как JSON."""
+    await conn.set_type_codec("jsonb", encoder=jsonlib.dumps, decoder=jsonlib.loads, schema="pg_catalog")
 
 
 class AsyncDatabaseManager:
@@ -18,9 +27,10 @@ class AsyncDatabaseManager:
     def __init__(self, config: DatabaseConfig | None = None) -> None:
         self.config = config or DatabaseConfig()
         self.pool: asyncpg.Pool | None = None
+        self._listen_conn: asyncpg.Connection | None = None
         self.logger = logging.getLogger(__name__)
 
-    async def connect(self):
+    async def connect(self, min_size: int = 1, max_size: int = 10):
         """Создание пула соединений с базой данных."""
         try:
             self.pool = await asyncpg.create_pool(
@@ -29,8 +39,11 @@ class AsyncDatabaseManager:
                 user=self.config.user,
                 password=self.config.password,
                 database=self.config.database,
-                min_size=1,
-                max_size=10,
+                min_size=min_size,
+                max_size=max_size,
+                statement_cache_size=self.config.statement_cache_size,
+                max_inactive_connection_lifetime=self.config.max_inactive_connection_lifetime,
+                init=_init_connection,
             )
             self.logger.debug(
                 f"Успешное подключение к БД: {self.config.host}:{self.config.port}/{self.config.database}"
@@ -42,18 +55,33 @@ class AsyncDatabaseManager:
     async def close(self):
         """Закрытие пула соединений."""
         if self.pool:
+            if self._listen_conn is not None:
+                await self.pool.release(self._listen_conn)
+                self._listen_conn = None
             await self.pool.close()
             self.logger.debug("Соединение с БД закрыто")
 
     async def execute(self, query: str, *params) -> str:
-        """Выполнение запроса без возврата результата."""
+        """
+        Выполнение запроса без возврата результата.
+
+        Одиночный запрос атомарен и без явной транзакции, а несколько запросов в одной строке
+        сервер выполняет в неявной транзакции, поэтому BEGIN/COMMIT (два лишних RTT) не нужны.
+        """
         if not self.pool:
             raise RuntimeError("Нет активного подключения к БД")
         async with self.pool.acquire() as conn:
-            async with conn.transaction():
-                await conn.execute(query, *params)
+            await conn.execute(query, *params)
         return "ok"
 
+    async def executemany(self, query: str, args: list[tuple]) -> None:
+        """Выполнение одного запроса для набора параметров в одной транзакции."""
+        if not self.pool:
+            raise RuntimeError("Нет активного подключения к БД")
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.executemany(query, args)
+
     async def fetch(self, query: str, *params) -> list[dict[str, Any]]:
         """Выполнение запроса с возвратом результата."""
         if not self.pool:
@@ -62,10 +90,66 @@ class AsyncDatabaseManager:
             rows = await conn.fetch(query, *params)
             return [dict(r) for r in rows]
 
-    async def fetchrow(self, query: str, *params) -> dict[str, Any] | None:
-        """Получение одной строки."""
+    async def fetchrow(self, query: str, *params) -> asyncpg.Record | None:
+        """Получение одной строки без копирования в dict."""
         if not self.pool:
             raise RuntimeError("Нет активного подключения к БД")
         async with self.pool.acquire() as conn:
-            row = await conn.fetchrow(query, *params)
-            return dict(row) if row else None
+            return await conn.fetchrow(query, *params)
+
+    async def iterate(self, query: str, *params, prefetch: int = 500) -> AsyncIterator[dict[str, Any]]:
+        """
+        Потоковое чтение результата через серверный курсор.
+
+        В памяти держится не больше prefetch строк; соединение занято до конца итерации.
+
+        Args:
+            query: SQL-запрос.
+            *params: Параметры запроса.
+            prefetch: Сколько строк забирать с сервера за один запрос.
+        """
+        if not self.pool:
+            raise RuntimeError("Нет активного подключения к БД")
+        async with self.pool.acquire() as conn, conn.transaction():
+            async for row in conn.cursor(query, *params, prefetch=prefetch):
+                yield dict(row)
+
+    async def add_listener(self, channel: str, callback: Callable[..., Any]) -> None:
+        """
+        Подписывается на NOTIFY канала.
+
+        Для LISTEN из пула берётся отдельное соединение, которое держится до close().
+
+        Args:
+            channel: Имя канала.
+            callback: Функция (connection, pid, channel, payload).
+        """
+        if not self.pool:
+            raise RuntimeError("Нет активного подключения к БД")
+        if self._listen_conn is None:
+            self._listen_conn = await self.pool.acquire()
+        await self._listen_conn.add_listener(channel, callback)
+
+
+_db: AsyncDatabaseManager | None = None
+_db_lock = asyncio.Lock()
+
+
+async def get_db() -> AsyncDatabaseManager:
+    """Возвращает общий для процесса менеджер БД, создавая пул при первом вызове."""
+    global _db
+    async with _db_lock:
+        if _db is None:
+            db = AsyncDatabaseManager()
+            await db.connect(min_size=config.DB_POOL_MIN_SIZE, max_size=config.DB_POOL_MAX_SIZE)
+            _db = db
+    return _db
+
+
+async def close_db() -> None:
+    """Закрывает общий пул соединений, если он был создан."""
+    global _db
+    async with _db_lock:
+        if _db is not None:
+            await _db.close()
+            _db = None
@@ -0,0 +1,40 @@
+import json
+from typing import Any
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# orjson, если установлен, иначе стандартный json; orjson.JSONDecodeError — подкласс json.JSONDecodeError
+JSONDecodeError = json.JSONDecodeError
+
+
+def loads(data: str | bytes) -> Any:
+    """Разбирает JSON из str или bytes."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj: Any) -> str:
+    """Сериализует объект в компактную JSON-строку без экранирования не-ASCII."""
+    if orjson is not None:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def dumps_bytes(obj: Any, indent: bool = False) -> bytes:
+    """
+    Сериализует объект в UTF-8 JSON; неизвестные типы приводятся через str().
+
+    Args:
+        obj: Объект для сериализации.
+        indent: True — отступ в 2 пробела для чтения человеком, иначе компактно.
+    """
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(obj, default=str, option=option)
+    if indent:
+        return json.dumps(obj, ensure_ascii=False, indent=2, default=str).encode()
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=str).encode()
@@ -42,7 +42,7 @@ class PhotoProcessor:
             response.raise_for_status()
             return response.content
         except requests.RequestException as e:
-            logger.debug(f"Ошибка запроса к URL {url}: {e}")
+            logger.debug("Ошибка запроса к URL %s: %s", url, e)
             return None
 
     def _get_image_data(self, source: str) -> bytes | None:
@@ -149,7 +149,7 @@ class PhotoProcessor:
             bgr_image = bgr_image[:, :, ::-1]
             face_locations = face_recognition.face_locations(bgr_image, model="hog")
             if not face_locations:
-                logger.debug(f"Лица не были найдены на {image_url} на этапе кодирования.")
+                logger.debug("Лица не были найдены на %s на этапе кодирования.", image_url)
                 return None
 
             image = face_recognition.load_image_file(BytesIO(image))
@@ -157,7 +157,7 @@ class PhotoProcessor:
             return encodings[0] if encodings else None
         except Exception as e:
             logger.warning(f"Ошибка кодирования лица для {image_url}")
-            logger.debug(f"{e}")
+            logger.debug("%s", e)
             return None
 
     def cluster_faces(self, image_urls: list[str], eps: float = 0.6, min_samples: int = 2) -> list[list[str]]:
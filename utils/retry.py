@@ -0,0 +1,53 @@
+import asyncio
+import functools
+import logging
+import random
+from collections.abc import Awaitable, Callable
+from typing import ParamSpec, TypeVar
+
+logger = logging.getLogger(__name__)
+
+P = ParamSpec("P")
+R = TypeVar("R")
+
+# Источник jitter: SystemRandom не делит состояние с модулем random и не требует подавления S311
+_jitter = random.SystemRandom()
+
+
+def async_retry(
+    attempts: int,
+    *,
+    wait_min: float,
+    wait_max: float,
+    retry_on: tuple[type[BaseException], ...] = (Exception,),
+) -> Callable[[Callable[P, Awaitable[R]]], Callable[P, Awaitable[R]]]:
+    """
+    Декоратор повторных попыток для корутин с экспоненциальной задержкой и jitter.
+
+    Перед попыткой N+1 ждёт случайное время из [wait_min, min(wait_max, wait_min * 2^N)].
+    После последней попытки пробрасывает исключение.
+
+    Args:
+        attempts: Максимальное количество попыток.
+        wait_min: Минимальная задержка между попытками, сек.
+        wait_max: Максимальная задержка между попытками, сек.
+        retry_on: Типы исключений, при которых нужна ещё попытка.
+    """
+    if attempts < 1:
+        raise ValueError(f"attempts должно быть >= 1, получено {attempts}")
+
+    def decorator(func: Callable[P, Awaitable[R]]) -> Callable[P, Awaitable[R]]:
+        @functools.wraps(func)
+        async def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+            for attempt in range(1, attempts + 1):
+                try:
+                    return await func(*args, **kwargs)
+                except retry_on as e:
+                    if attempt == attempts:
+                        raise
+                    logger.warning(f"{func.__qualname__}: ошибка на попытке {attempt}/{attempts}: {e}")
+
+                delay = _jitter.uniform(wait_min, min(wait_max, wait_min * 2 ** attempt))
+                await asyncio.sleep(delay)
+        return wrapper
+    return decorator
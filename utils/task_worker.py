@@ -3,8 +3,9 @@ import logging
 
 import config
 from handlers import llm, perp, postcheck1, postcheck2, prellm
+from logger import log_context
 from services.fill_task_queue import TaskQueue
-from utils.db import AsyncDatabaseManager
+from utils.db import AsyncDatabaseManager, get_db
 
 logger = logging.getLogger(__name__)
 
@@ -17,6 +18,50 @@ HANDLERS = {
     # "photos": photos.run
 }
 
+BATCH_HANDLERS = {
+    "llm": llm.run_batch,
+    "perp": perp.run_batch,
+    "postcheck1": postcheck1.run_batch,
+    "postcheck2": postcheck2.run_batch,
+}
+
+# У каждого воркера своё событие пробуждения: сброс одним воркером не теряет NOTIFY для других
+_worker_wakeups: set[asyncio.Event] = set()
+# Сколько воркеров сейчас выполняют задачи (и могут создать следующие)
+_busy_workers = 0
+
+
+def _on_task_notify(connection, pid: int, channel: str, payload: str) -> None:
+    for wakeup in _worker_wakeups:
+        wakeup.set()
+
+
+async def start_task_listener(db: AsyncDatabaseManager) -> None:
+    """Подписывает воркеры на уведомления о новых задачах в task_queue."""
+    if db.config.pgbouncer:
+        # В transaction-режиме pgbouncer LISTEN не работает: воркеры ждут задачи по таймауту
+        logger.info("pgbouncer: уведомления о новых задачах отключены")
+        return
+    await db.add_listener(config.TASK_QUEUE_CHANNEL, _on_task_notify)
+
+
+async def wait_for_new_task(wakeup: asyncio.Event, timeout: float) -> bool:
+    """
+    Ждёт уведомления о новой задаче.
+
+    Args:
+        wakeup: Событие пробуждения воркера.
+        timeout: Максимальное время ожидания, сек.
+
+    Returns:
+        bool: True, если уведомление пришло до истечения timeout.
+    """
+    try:
+        await asyncio.wait_for(wakeup.wait(), timeout)
+    except TimeoutError:
+        return False
+    return True
+
 
 async def fetch_pending_task(db: AsyncDatabaseManager) -> dict | None:
     """
@@ -33,6 +78,19 @@ async def fetch_pending_task(db: AsyncDatabaseManager) -> dict | None:
     return rows[0]
 
 
+async def fetch_pending_tasks(db: AsyncDatabaseManager, task_type: str, limit: int) -> list[dict]:
+    """
+    Извлекает до `limit` задач указанного типа со статусом 'pending'
+    и помечает их как 'in_progress'.
+
+    Returns:
+        list[dict]: список задач (может быть пустым).
+    """
+    if limit <= 0:
+        return []
+    return await db.fetch(config.TAKE_PENDING_TASKS_BY_TYPE_QUERY, task_type, limit)
+
+
 async def create_new_task(person_id: int, current_task: str) -> None:
     """
     Создаёт следующую задачу для персоны на основе текущей.
@@ -44,10 +102,10 @@ async def create_new_task(person_id: int, current_task: str) -> None:
     next_task = config.NEXT_TASK.get(current_task)
 
     if not next_task:
-        logger.debug(f"[person_id={person_id}] Нет следующей задачи после {current_task}")
+        logger.debug("[person_id=%s] Нет следующей задачи после %s", person_id, current_task)
         return
 
-    queue = TaskQueue()
+    queue = TaskQueue(await get_db())
     await queue.add_for_person(person_id, next_task)
 
 
@@ -64,7 +122,7 @@ async def mark_task_status(db: AsyncDatabaseManager, task_id: int, status: bool,
     if status:
         query = "UPDATE task_queue SET status='done', finished_at=NOW() WHERE id=$1"
         await db.execute(query, task_id)
-        logger.debug(f"Задача {task_id} помечена как 'done'.")
+        logger.debug("Задача %s помечена как 'done'.", task_id)
     else:
         query = """
             UPDATE task_queue
@@ -72,7 +130,29 @@ async def mark_task_status(db: AsyncDatabaseManager, task_id: int, status: bool,
             WHERE id=$2
         """
         await db.execute(query, error or "Unknown error", task_id)
-        logger.debug(f"Задача {task_id} помечена как 'failed': {error}")
+        logger.debug("Задача %s помечена как 'failed': %s", task_id, error)
+
+
+async def mark_tasks_status(db: AsyncDatabaseManager, done_ids: list[int], failed: list[tuple[str, int]]) -> None:
+    """
+    Обновляет статусы пачки задач: все выполненные одним UPDATE, проваленные одним executemany.
+
+    Args:
+        db: Подключение к БД.
+        done_ids: Идентификаторы выполненных задач.
+        failed: Пары (текст ошибки, идентификатор задачи) для проваленных задач.
+    """
+    if done_ids:
+        await db.execute("UPDATE task_queue SET status='done', finished_at=NOW() WHERE id = ANY($1::int[])", done_ids)
+        logger.debug("Задачи %s помечены как 'done'.", done_ids)
+    if failed:
+        query = """
+            UPDATE task_queue
+            SET status='failed', finished_at=NOW(), retries=retries+1, last_error=$1
+            WHERE id=$2
+        """
+        await db.executemany(query, failed)
+        logger.debug("Задачи %s помечены как 'failed'.", [task_id for _, task_id in failed])
 
 
 async def run_handler(worker_id: int, task_type: str, person_id: int) -> bool:
@@ -88,9 +168,9 @@ async def run_handler(worker_id: int, task_type: str, person_id: int) -> bool:
     if not handler:
         raise ValueError(f"Неизвестный тип задачи: {task_type}")
 
-    logger.debug(f"[Воркер #{worker_id}][person_id={person_id}] Запуск обработчика '{task_type}'")
+    logger.debug("[Воркер #%s][person_id=%s] Запуск обработчика '%s'", worker_id, person_id, task_type)
     status = await handler(worker_id, person_id)
-    logger.debug(f"[Воркер #{worker_id}][person_id={person_id}] Завершён обработчик '{task_type}'")
+    logger.debug("[Воркер #%s][person_id=%s] Завершён обработчик '%s'", worker_id, person_id, task_type)
     return status
 
 
@@ -112,31 +192,92 @@ async def process_task(db: AsyncDatabaseManager, task: dict, worker_id: int) ->
         await mark_task_status(db, task_id, True)  # TODO: сделать нормальные return в handlers
         if status:
             await create_new_task(person_id, task_type)
-        logger.info(f"[Воркер #{worker_id}][person_id={person_id}] ✅ Задача {task_type} завершена успешно")
+        logger.info("[Воркер #%s][person_id=%s] Задача %s завершена успешно", worker_id, person_id, task_type)
     except Exception as e:
         logger.exception(f"[Воркер #{worker_id}] ❌ Ошибка при выполнении {task_type}: {e}")
         await mark_task_status(db, task_id, False, str(e))
 
 
+async def process_batch(db: AsyncDatabaseManager, tasks: list[dict], worker_id: int) -> None:
+    """
+    Выполняет пачку задач одного типа через пакетный обработчик.
+
+    Обработчик возвращает результат по каждому найденному person_id:
+    True — задача выполнена и создаётся следующая, False — задача провалена.
+    Персоны, отсутствующие в результате, помечаются выполненными без следующей задачи.
+
+    Args:
+        db: Подключение к БД.
+        tasks: Задачи одного типа.
+        worker_id: Идентификатор воркера.
+    """
+    task_type = tasks[0]["task_type"]
+    person_ids = [task["person_id"] for task in tasks]
+
+    try:
+        results = await BATCH_HANDLERS[task_type](worker_id, person_ids)
+    except Exception as e:
+        logger.exception(f"[Воркер #{worker_id}] ❌ Ошибка при выполнении пачки {task_type}: {e}")
+        await mark_tasks_status(db, [], [(str(e), task["id"]) for task in tasks])
+        return
+
+    done_ids, failed, next_person_ids = [], [], []
+    for task in tasks:
+        person_id = task["person_id"]
+        status = results.get(person_id)
+        if status is False:
+            failed.append((f"Обработчик {task_type} вернул ошибку", task["id"]))
+            continue
+        done_ids.append(task["id"])
+        if status:
+            next_person_ids.append(person_id)
+
+    await mark_tasks_status(db, done_ids, failed)
+    await asyncio.gather(*(create_new_task(person_id, task_type) for person_id in next_person_ids))
+    logger.info("[Воркер #%s] Пачка %s из %s задач завершена", worker_id, task_type, len(tasks))
+
+
 async def worker_loop(worker_id: int, db: AsyncDatabaseManager) -> None:
     """
     Основной цикл выполнения задач воркером.
-    Цикл работает бесконечно, проверяя очередь каждые 5 секунд.
+    Когда очередь пуста, воркер ждёт NOTIFY о новых задачах вместо опроса БД.
+    Завершается, только если за TASK_WAIT_TIMEOUT ничего не пришло и ни один воркер
+    не занят задачей — иначе следующая задача ещё может появиться, и очередь проверяется снова.
 
     Args:
         worker_id: Идентификатор воркера.
         db: Подключение к базе данных.
     """
+    global _busy_workers
     logger.info(f"🚀 Воркер #{worker_id} запущен")
+    wakeup = asyncio.Event()
+    _worker_wakeups.add(wakeup)
+
+    try:
+        while True:
+            try:
+                wakeup.clear()
+                task = await fetch_pending_task(db)
+                if not task:
+                    if await wait_for_new_task(wakeup, config.TASK_WAIT_TIMEOUT) or _busy_workers:
+                        continue
+                    return
 
-    while True:
-        try:
-            task = await fetch_pending_task(db)
-            if not task:
-                await asyncio.sleep(3)
-                return  # TODO: должен быть continue
-
-            await process_task(db, task, worker_id)
-        except Exception as e:
-            logger.exception(f"[Воркер #{worker_id}] Ошибка в основном цикле: {e}")
-            await asyncio.sleep(5)
+                task_type = task["task_type"]
+                log_context.set(task_type)
+                _busy_workers += 1
+                try:
+                    if task_type in BATCH_HANDLERS:
+                        tasks = [task, *await fetch_pending_tasks(db, task_type, config.CHUNK_SIZE - 1)]
+                        await process_batch(db, tasks, worker_id)
+                    else:
+                        await process_task(db, task, worker_id)
+                finally:
+                    _busy_workers -= 1
+            except Exception as e:
+                logger.exception(f"[Воркер #{worker_id}] Ошибка в основном цикле: {e}")
+                await asyncio.sleep(5)
+            finally:
+                log_context.set("")
+    finally:
+        _worker_wakeups.discard(wakeup)